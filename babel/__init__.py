@@ -1,3 +1,3 @@
-from .markos import NoteMarkos, Markos, TimeMarkos, ChordMarkos
+from .markos import NoteMarkos, Markos, SparseMarkos, NGramMarkos, TimeMarkos, ChordMarkos
 from .babel import Babel
-from .synth import Compiler, Synth, parser, instructions, cmd_rel_note, cmd_chord
\ No newline at end of file
+from .synth import Compiler, Synth, Events, parser, instructions, cmd_rel_note, cmd_chord
\ No newline at end of file
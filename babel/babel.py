@@ -10,9 +10,38 @@
     4 : nota de referência é a 1/4 (índice 2)
 
 """
-from .markos import Markos, TimeMarkos, ChordMarkos, NoteMarkos, Fraction
+import json
+
+import numpy as np
+
+from .markos import Markos, TimeMarkos, ChordMarkos, NoteMarkos, NGramTimeMarkos, NGramChordMarkos, Fraction, concat, savez, loadz
 from .synth import Synth
 
+CHORD = -1 ## tempo column of chord rows, in training codes
+
+def encode(data: list) -> np.ndarray:
+    """ [(note, tempo), (chord, None), ...] -> (m x 2) int codes,
+        with CHORD in place of None
+    """
+    codes = np.array([(n, CHORD if t is None else t) for n, t in data], dtype=np.int64)
+    return codes.reshape(-1, 2)
+
+def codes(fname: str) -> np.ndarray:
+    """ Compiles a source file to training codes (relative notes and chords),
+        or None if it does not compile.
+    """
+    from .synth import Compiler, instructions, cmd_rel_note, cmd_chord
+
+    with open(fname, 'r') as file:
+        source = file.read()
+
+    compiler = Compiler('scanner', {**instructions, 'NOTE': cmd_rel_note, 'CHORD': cmd_chord})
+
+    try:
+        return encode(compiler.compile(source))
+    except (SyntaxError, ValueError, KeyError):
+        return None
+
 class Babel:
 
     FREQ = 440.0 #Hz
@@ -40,9 +69,20 @@ class Babel:
 
         self.k: int = 0 ## contador de compassos
 
-        self.cm = ChordMarkos()
-        self.nm = NoteMarkos()
-        self.tm = TimeMarkos(self.C)
+        ## notes, chords and tempos of context
+        if 'order' in kwargs:
+            self.order: int = max(1, int(kwargs['order']))
+        else:
+            self.order: int = 1
+
+        if self.order > 1:
+            self.cm = NGramChordMarkos(self.order)
+            self.nm = NoteMarkos(order=self.order)
+            self.tm = NGramTimeMarkos(self.C, self.order)
+        else:
+            self.cm = ChordMarkos()
+            self.nm = NoteMarkos()
+            self.tm = TimeMarkos(self.C)
 
         ##self.cm.basic_train()
         ##self.nm.basic_train()
@@ -82,29 +122,236 @@ class Babel:
         else:
             return notes
 
+    def history(self, model, chains: int) -> np.ndarray:
+        """ (chains x order) copies of a model's recent states (-1: none)
+        """
+        h = np.full((chains, model.order), -1, dtype=np.int64)
+        recent = getattr(model, 'history', None) or ([] if model.prev is None else [model.prev])
+        if recent:
+            h[:, -len(recent):] = recent[-model.order:]
+        return h
+
+    def compose_batch(self, k: int, chains: int) -> tuple:
+        """ `chains` independent compositions of k bars (as `compose`),
+            advanced in lockstep: each step draws one vector of uniforms and
+            every chain's next chord, duration (masked as in TimeMarkos) and
+            note with array lookups.
+            Models are left untouched; chains start from their current state.
+
+            -> (frequencies, durations, lengths), the first two being
+               (chains x steps) arrays padded with NaN past each length.
+        """
+        L = self.tm.L
+        fits = np.array(self.tm.fits, dtype=np.int64)
+
+        ## lookup tables: state -> frequency(Hz), lenght(s)
+        freq = self.FREQ * np.power(2.0, np.arange(self.nm[0].n) / 12.0)
+        dur = (self.C[1] / np.power(2.0, np.arange(self.tm.n))) * (60.0 / self.tempo)
+        ticks = self.tm.TICKS >> np.arange(self.tm.n)
+
+        ch = self.history(self.cm, chains)
+        th = self.history(self.tm, chains)
+        nh = np.stack([self.history(self.nm[c], chains) for c in range(7)], axis=1) ## chains x chord x order
+
+        c = np.zeros(chains, dtype=np.int64)
+        s = np.full(chains, -1, dtype=np.int64) ## ticks into the bar, -1 : new bar
+        bars = np.zeros(chains, dtype=np.int64)
+        active = np.flatnonzero(bars < k)
+
+        notes, times = [], []
+        while active.size:
+            u = self.cm.rng.generator.random((3, active.size))
+
+            ## new bar: chord
+            new = s[active] < 0
+            if new.any():
+                i = active[new]
+                c[i] = self.cm.draw(ch[i], u[0, new])
+                ch[i] = np.roll(ch[i], -1, axis=1)
+                ch[i, -1] = c[i]
+                s[i] = 0
+                bars[i] += 1
+
+            ## duration, among those that fit the bar
+            t = self.tm.draw(th[active], u[1], first=fits[L - s[active]])
+            th[active] = np.roll(th[active], -1, axis=1)
+            th[active, -1] = t
+            s[active] += ticks[t]
+            s[active[s[active] == L]] = -1
+
+            ## note, under the bar's chord
+            cc = c[active]
+            h = nh[active, cc]
+            n = self.nm.draw(cc, h, u[2])
+            h = np.roll(h, -1, axis=1)
+            h[:, -1] = n
+            nh[active, cc] = h
+
+            step = np.full((2, chains), -1, dtype=np.int64)
+            step[0, active] = n
+            step[1, active] = t
+            notes.append(step[0])
+            times.append(step[1])
+
+            active = active[bars[active] < k]
+
+        notes = np.array(notes, dtype=np.int64).reshape(-1, chains).T
+        times = np.array(times, dtype=np.int64).reshape(-1, chains).T
+        lengths = np.sum(notes >= 0, axis=1)
+
+        frequencies = np.where(notes >= 0, freq[notes], np.nan)
+        durations = np.where(times >= 0, dur[times], np.nan)
+        return (frequencies, durations, lengths)
+
     def play(self, k: int):
         notes = self.compose(k)
         wave = self.synth.synth(notes)
         self.synth.play(wave, sync=True)
 
+    def live(self, seconds: float = None, sink=None, **kwargs) -> dict:
+        """ Plays an endless composition in real time, rendering as it plays.
+
+            sink : audio output (defaults to simpleaudio)
+            kwargs : Player options (latency, period, peak)
+            -> playback stats
+        """
+        from .synth.player import Player, SimpleAudioSink
+
+        if sink is not None: ## the caller's sink stays open
+            return Player(self.synth, sink, **kwargs).play(iter(self), seconds)
+
+        with SimpleAudioSink(self.synth.sample_rate, self.synth.channels, self.synth.bits) as sink:
+            return Player(self.synth, sink, **kwargs).play(iter(self), seconds)
+
+    def save(self, fname: str):
+        """ Writes settings, every trained model and the composition state
+            (current bar, chord and history) to one .npz file: a loaded
+            instance continues the composition where this one was.
+
+            >>> bb.train_files(glob('archive/*.mus'))
+            >>> bb.save('babel.npz')
+            >>> bb = Babel.load('babel.npz') ## no training at startup
+        """
+        meta = {
+            'C': list(self.C), 'tempo': self.tempo, 'instrument': self.instrument, 'order': self.order,
+            ## where the composition is: chord, last duration and note, bars
+            'c': int(self.c), 't': None if self.t is None else int(self.t), 'n': int(self.n), 'k': int(self.k),
+        }
+        savez(fname, {
+            'meta': np.array(json.dumps(meta)),
+            **self.cm._dump('cm/'),
+            **self.tm._dump('tm/'),
+            **self.nm._dump('nm/'),
+        })
+
+    @classmethod
+    def load(cls, fname: str, mmap: bool = True):
+        """ mmap : models are memory-mapped (see `Markos.load`), so worker
+                   processes share one copy of a large model.
+        """
+        arrays = loadz(fname, mmap)
+        meta = json.loads(str(arrays['meta']))
+        bb = cls(C=tuple(meta['C']), tempo=meta['tempo'], instrument=meta['instrument'], order=meta['order'])
+        bb.cm._undump(arrays, 'cm/')
+        bb.tm._undump(arrays, 'tm/')
+        bb.nm._undump(arrays, 'nm/')
+        bb.c, bb.t, bb.n, bb.k = meta['c'], meta['t'], meta['n'], meta['k']
+        return bb
+
     def train (self, data: list, weight: int = 1):
         """ data: [(note, tempo), (note, tempo), (chord, None)]
         """
-        chord = 0
-        ndata = {key: [] for key in range(7)}
-        cdata = [chord]
-        tdata = []
-
-        for n, t in data:
-            if t is None:
-                chord = n
-                cdata.append(chord)
-            else:
-                ndata[chord].append(n)
-                tdata.append(t)
-
-        self.cm.train(cdata, weight=weight)
-        self.tm.train(tdata, weight=weight)
-
-        for key in ndata:
-            self.nm[key].train(ndata[key], weight=weight)
\ No newline at end of file
+        self.fit(encode(data), weight=weight)
+
+    def fit(self, codes: np.ndarray, weight: int = 1, starts=None):
+        """ Trains on many scores at once, without Python loops over notes.
+
+            codes : (m x 2) int array of (note, tempo) and (chord, CHORD) rows,
+                    scores laid end to end
+            starts : row where each score begins
+
+            Each score starts on chord 0; notes are trained per chord, in
+            the order they appear within their score.
+        """
+        codes = np.asarray(codes, dtype=np.int64).reshape(-1, 2)
+        m = len(codes)
+        if starts is None:
+            starts = [0]
+
+        first = np.zeros(m, dtype=bool) ## score boundaries
+        first[np.asarray(starts, dtype=np.int64)[np.asarray(starts) < m]] = True
+        score = np.cumsum(first) - 1
+
+        chord = codes[:, 1] == CHORD
+        x = codes[:, 0]
+
+        ## chords: each score is [0, c1, c2, ...]
+        c, s = x[chord], score[chord]
+        i = np.flatnonzero(np.diff(s, prepend=-1))
+        self.cm.train(np.insert(c, i, 0), weight, starts=i + np.arange(len(i)))
+
+        ## tempos, per score
+        note = ~chord
+        self.tm.train(codes[note, 1], weight, starts=np.flatnonzero(np.diff(score[note], prepend=-1)))
+
+        ## notes, per score and current chord
+        i = np.where(chord | first, np.arange(m), 0)
+        np.maximum.accumulate(i, out=i)
+        key = np.where(chord[i], x[i], 0)[note]
+
+        n, s = x[note], score[note]
+        order = np.lexsort((s, key)) ## stable: keeps note order within a (chord, score)
+        n, s, key = n[order], s[order], key[order]
+        bounds = np.searchsorted(key, np.arange(8)).tolist()
+        for k in range(7):
+            a, b = bounds[k], bounds[k + 1]
+            if a < b:
+                self.nm[k].train(n[a:b], weight, starts=np.flatnonzero(np.diff(s[a:b], prepend=-1)))
+
+    def fit_events(self, events, weight: int = 1, starts=None):
+        """ Trains on compiled `Events` (e.g. from the compile cache).
+
+            Events carry absolute pitches and no chords: notes are taken
+            in semitones from FREQ, all under chord 0, and durations are
+            mapped back to tempo codes with this instance's C and tempo.
+            Pauses are dropped.
+        """
+        f = np.asarray(events.frequency, dtype=float)
+        d = np.asarray(events.duration, dtype=float)
+        keep = ~np.isnan(f)
+
+        n = np.rint(12.0 * np.log2(f[keep] / self.FREQ)).astype(np.int64)
+        t = np.rint(np.log2(self.C[1] * (60.0 / self.tempo) / d[keep]))
+        t = np.clip(t, 0, self.tm.n - 1).astype(np.int64)
+
+        if starts is not None: ## minus the pauses before each start
+            starts = np.concatenate([[0], np.cumsum(keep)])[np.asarray(starts, dtype=np.int64)]
+
+        self.fit(np.stack([n, t], axis=1), weight=weight, starts=starts)
+
+    def train_files(self, fnames: list, weight: int = 1, jobs: int = 1) -> int:
+        """ Compiles and trains on many source files (e.g. a directory
+            of .mus files), compiling in `jobs` parallel processes.
+            Returns the number of files used; those that do not compile
+            are skipped.
+        """
+        from pathlib import Path
+
+        fnames = [
+            str(f) for name in fnames
+            for f in (sorted(Path(name).glob('*.mus')) if Path(name).is_dir() else [Path(name)])
+        ]
+
+        if jobs <= 1:
+            scores = [codes(f) for f in fnames]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                scores = list(pool.map(codes, fnames, chunksize=max(1, len(fnames) // (4 * jobs))))
+
+        scores = [x for x in scores if x is not None]
+        if scores:
+            data, starts = concat([x.ravel() for x in scores])
+            self.fit(data.reshape(-1, 2), weight=weight, starts=starts // 2)
+        return len(scores)
\ No newline at end of file
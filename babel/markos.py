@@ -1,72 +1,667 @@
+from bisect import bisect_left, bisect_right
 from fractions import Fraction
+import json
 import numpy as np
 
+def pairs(data, starts=None) -> tuple:
+    """ Consecutive (rows, cols) of a concatenation of sequences.
+
+        data : 1-D int array, sequences laid end to end
+        starts : index where each sequence begins (no pairs across them)
+    """
+    data = np.asarray(data, dtype=np.int64)
+    rows, cols = data[:-1], data[1:]
+    if starts is not None and len(data):
+        keep = np.ones(len(data) - 1, dtype=bool)
+        starts = np.asarray(starts, dtype=np.int64)
+        starts = starts[(starts > 0) & (starts < len(data))]
+        keep[starts - 1] = False
+        rows, cols = rows[keep], cols[keep]
+    return (rows, cols)
+
+def concat(sequences: list) -> tuple:
+    """ [sequence, ...] -> (data, starts)
+    """
+    sequences = [np.asarray(x, dtype=np.int64).ravel() for x in sequences]
+    lengths = np.array([len(x) for x in sequences], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]) if len(sequences) else lengths
+    return (np.concatenate([np.zeros(0, dtype=np.int64), *sequences]), starts)
+
+def merge(keys: np.ndarray, counts: np.ndarray, pending: list) -> tuple:
+    """ Adds pending [(keys, weights), ...] into sorted unique keys and counts.
+    """
+    if not pending:
+        return (keys, counts)
+    keys = np.concatenate([keys, *(k for k, _ in pending)])
+    counts = np.concatenate([counts, *(w for _, w in pending)])
+    keys, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(keys)).astype(np.int64)
+    pending.clear()
+    return (keys, counts)
+
+def positions(m: int, starts=None) -> np.ndarray:
+    """ Index of each of m items within its own sequence.
+    """
+    first = np.zeros(m, dtype=bool)
+    if m:
+        first[0] = True
+    if starts is not None:
+        starts = np.asarray(starts, dtype=np.int64)
+        first[starts[(starts >= 0) & (starts < m)]] = True
+    i = np.arange(m)
+    return i - np.maximum.accumulate(np.where(first, i, 0))
+
+def search(keys: np.ndarray, cum: np.ndarray, rows: np.ndarray, n: int, u: np.ndarray, first=None) -> tuple:
+    """ Draws the next state of many rows at once -> (states, found)
+
+        keys : sorted flat keys (row * n + state) of nonzero counts
+        cum : running total of their counts
+        u : one uniform per row
+        first : lowest state allowed, per row (masks the rest out)
+
+        Rows without (allowed) counts are not found (their state is meaningless).
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if not keys.size:
+        return (np.zeros(len(rows), dtype=np.int64), np.zeros(len(rows), dtype=bool))
+
+    a = np.searchsorted(keys, rows * n if first is None else rows * n + first)
+    b = np.searchsorted(keys, rows * n + n)
+    found = b > a
+    base = np.where(a > 0, cum[a - 1], 0)
+    i = np.searchsorted(cum, base + u * (cum[np.maximum(b - 1, 0)] - base), side='right')
+    i = np.clip(i, a, np.maximum(b - 1, a)) ## rounding at the row end
+    return (keys[np.minimum(i, len(keys) - 1)] - rows * n, found)
+
+def compact(x: np.ndarray) -> np.ndarray:
+    """ x, in the smallest signed int type that holds its values (counts
+        are mostly small).
+    """
+    if not x.size:
+        return x
+    for t in (np.int8, np.int16, np.int32):
+        if np.iinfo(t).min <= x.min() and x.max() <= np.iinfo(t).max:
+            return x.astype(t)
+    return x
+
+def savez(fname: str, arrays: dict):
+    """ Writes arrays to an uncompressed .npz, which `loadz` can map.
+    """
+    np.savez(fname, **arrays)
+
+def loadz(fname: str, mmap: bool = True) -> dict:
+    """ .npz -> {name: read-only array}
+
+        mmap : map the file once and view each (uncompressed) member in
+               place, as np.load(mmap_mode='r') does for .npy files: pages
+               are read on demand, and shared by every process mapping
+               the same file.
+    """
+    import mmap as _mmap
+    import zipfile
+
+    headers = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+    arrays = {}
+    with zipfile.ZipFile(fname) as archive, open(fname, 'rb') as file:
+        buffer = _mmap.mmap(file.fileno(), 0, access=_mmap.ACCESS_READ) if mmap else None
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            x = None
+
+            if buffer is not None and info.compress_type == zipfile.ZIP_STORED:
+                ## member data: after its local header (30 bytes, name, extra field)
+                file.seek(info.header_offset + 26)
+                file.seek(int.from_bytes(file.read(2), 'little') + int.from_bytes(file.read(2), 'little'), 1)
+                version = np.lib.format.read_magic(file)
+                if version in headers:
+                    shape, fortran, dtype = headers[version](file)
+                    if not dtype.hasobject:
+                        x = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=file.tell(), order=('F' if fortran else 'C'))
+
+            if x is None: ## compressed: read
+                with archive.open(info) as member:
+                    x = np.lib.format.read_array(member, allow_pickle=False)
+                x.flags.writeable = False
+
+            arrays[name] = x
+    return arrays
+
+class Uniforms:
+    """ Uniform [0, 1) draws from one `np.random.Generator`, drawn ahead
+        in blocks, so that a single draw costs no numpy call.
+
+        >>> Markos.rng.seed(42) ## reproducible compositions
+    """
+
+    size = 4096
+
+    def __init__(self, seed=None):
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        self.generator = np.random.default_rng(seed)
+        self.buffer = []
+        self.i = 0
+
+    def __call__(self) -> float:
+        if self.i == len(self.buffer):
+            self.buffer = self.generator.random(self.size).tolist()
+            self.i = 0
+        self.i += 1
+        return self.buffer[self.i - 1]
+
 class Markos:
 
+    ## shared by every model
+    rng = Uniforms()
+
+    ## states of context
+    order = 1
+
     def __init__ (self, n):
         self.n = n
         self.r = np.arange(0, n, dtype=int)
         self._p = np.zeros((self.n, self.n), dtype=int)
         self._p_normal = np.empty((self.n, self.n), dtype=float)
         self._p_dirty = True
+        self._p_stale = True ## _p_normal
+        self._rows = {} ## state -> (next states, cumulative counts)
+        self._flat = None ## (flat keys, cumulative counts), for batch draws
         
         self.prev = None
 
     @property
     def p(self):
-        if self._p_dirty:
+        self._compile()
+        if self._p_stale:
             self._p_normal[:] = np.divide(self._p, np.add(np.sum(self._p, axis=1)[:, np.newaxis], (self._p == 0)))
-            self._p_dirty = False
+            self._p_stale = False
         return self._p_normal
 
+    @property
+    def nbytes(self) -> int:
+        """ memory used by the transition tables
+        """
+        self._compile()
+        return self._p.nbytes + self._p_normal.nbytes
+
+    def _compile(self):
+        """ Drops sampling tables after training.
+        """
+        if self._p_dirty:
+            self._rows = {}
+            self._flat = None
+            self._p_stale = True
+            self._p_dirty = False
+
+    def _table(self) -> tuple:
+        """ (flat keys, cumulative counts) of every row, for `draw`
+        """
+        if self._p_dirty:
+            self._compile()
+        if self._flat is None:
+            keys = np.flatnonzero(self._p)
+            self._flat = (keys, np.cumsum(self._p.flat[keys]))
+        return self._flat
+
+    def draw(self, history, u, first=None) -> np.ndarray:
+        """ Next states of many independent chains at once, without
+            touching this model's own state.
+
+            history : (chains x k) recent states, most recent last (-1: none)
+                      or (chains,) current states
+            u : (chains,) uniforms
+            first : (chains,) lowest state allowed; chains where no trained
+                    state is allowed get `first`
+        """
+        history = np.asarray(history, dtype=np.int64)
+        prev = history[:, -1] if history.ndim > 1 else history
+        keys, cum = self._table()
+        states, found = search(keys, cum, prev % self.n, self.n, np.asarray(u), first)
+        if (prev < 0).any() or (first is None and not found.all()):
+            raise ValueError(f'No transitions from state {prev[~found | (prev < 0)][0]}')
+        elif first is not None:
+            states = np.where(found, states, first)
+        return states
+
+    def _row(self, i: int) -> tuple:
+        """ (next states, cumulative counts) from state i, as lists
+        """
+        j = np.flatnonzero(self._p[i])
+        return (j.tolist(), np.cumsum(self._p[i, j]).tolist())
+
+    def save(self, fname: str):
+        """ Writes the trained counts (and current state) to a .npz file.
+
+            >>> m.save('chords.npz')
+            >>> m = ChordMarkos().load('chords.npz')
+        """
+        savez(fname, self._dump())
+
+    def load(self, fname: str, mmap: bool = True):
+        """ Reads counts written by `save` -> self
+
+            mmap : counts are memory-mapped (read-only) instead of read, so
+                   processes loading the same file share one copy; training
+                   again copies them first.
+        """
+        self._undump(loadz(fname, mmap))
+        return self
+
+    def _dump(self, prefix: str = '') -> dict:
+        """ {name: array} to be saved, under `prefix`
+        """
+        self._compile()
+        meta = {'class': type(self).__name__, 'n': self.n, 'order': self.order, 'state': self._state()}
+        return {f'{prefix}meta': np.array(json.dumps(meta)), **{prefix + k: x for k, x in self._counts_arrays().items()}}
+
+    def _undump(self, arrays: dict, prefix: str = ''):
+        meta = json.loads(str(arrays[f'{prefix}meta']))
+        if (meta['class'], meta['n'], meta['order']) != (type(self).__name__, self.n, self.order):
+            raise ValueError(
+                f"Saved {meta['class']} (n = {meta['n']}, order {meta['order']}) "
+                f"does not fit {type(self).__name__} (n = {self.n}, order {self.order})"
+            )
+        self._load_counts({k[len(prefix):]: x for k, x in arrays.items() if k.startswith(prefix)})
+        self._p_dirty = True
+        self._restore(meta['state'])
+
+    def _counts_arrays(self) -> dict:
+        return {'p': compact(self._p)}
+
+    def _load_counts(self, arrays: dict):
+        self._p = arrays['p']
+
+    def _state(self):
+        """ JSON state saved with the counts (see `_restore`)
+        """
+        return None if self.prev is None else int(self.prev)
+
+    def _restore(self, state):
+        if state is not None:
+            self.seed(state)
+
     def seed(self, x: int):
         self.prev = x
 
-    def train(self, data, weight=1):
-        for i in zip(data[:-1], data[1:]):
-            self._p[i] += weight
+    def train(self, data, weight=1, starts=None):
+        """ data : state sequence, or many laid end to end (see `starts`)
+            starts : index where each sequence begins
+        """
+        self.add(*pairs(data, starts), weight)
+
+    def train_many(self, sequences: list, weight=1):
+        """ Trains on every sequence at once.
+        """
+        data, starts = concat(sequences)
+        self.train(data, weight, starts)
+
+    def add(self, rows, cols, weight=1):
+        """ Adds `weight` to every (rows[k], cols[k]) transition count.
+            States wrap around modulo n, as negative indices do.
+        """
+        keys = (np.asarray(rows, dtype=np.int64) % self.n) * self.n + (np.asarray(cols, dtype=np.int64) % self.n)
+        if not keys.size:
+            return
+        if not self._p.flags.writeable: ## loaded (see `load`)
+            self._p = self._p.astype(int)
+        if keys.size < self._p.size // 16: ## few pairs: scatter
+            np.add.at(self._p.reshape(-1), keys.ravel(), np.asarray(weight, dtype=self._p.dtype))
+        else: ## many pairs: count over the whole matrix
+            self._p += np.bincount(
+                keys.ravel(),
+                weights=np.broadcast_to(np.asarray(weight, dtype=float), keys.shape).ravel(),
+                minlength=self._p.size
+            ).astype(self._p.dtype).reshape(self._p.shape)
         self._p_dirty = True
 
     def __next__(self):
-        self.prev = np.random.choice(self.r, p=self.p[self.prev])
-        return self.prev
+        """ Inverse CDF sampling: O(log n) binary search on the cumulative
+            counts of the current row. Row tables are built on first use
+            after training, and kept as lists so a draw makes no numpy call.
+        """
+        x = self._sample()
+        if x is None:
+            raise ValueError(f'No transitions from state {self.prev}')
+        self._step(x)
+        return x
+
+    def _sample(self, first: int = 0):
+        """ Next state, among those >= first, or None if none was trained.
+        """
+        if self._p_dirty:
+            self._compile()
+
+        row = self._rows.get(self.prev)
+        if row is None:
+            row = self._rows[self.prev] = self._row(self.prev)
+
+        return self._choose(*row, first)
+
+    def _choose(self, states: list, cum: list, first: int = 0):
+        q = bisect_left(states, first) if first else 0
+        base = cum[q - 1] if q else 0
+        if not cum or cum[-1] == base:
+            return None
+        i = bisect_right(cum, base + self.rng() * (cum[-1] - base))
+        return states[min(i, len(states) - 1)]
+
+    def _step(self, x: int):
+        self.prev = x
 
     def __iter__(self):
         while True:
             yield self.__next__()
 
+class SparseMarkos(Markos):
+    """ Markos with sparse transition counts, for large n.
+
+        Counts are kept as sorted flat keys (i * n + j) and their counts,
+        i.e. the rows of a CSR matrix laid end to end. Training appends
+        to a pending list, merged on the next draw; each row is then
+        sampled from its own nonzero entries:
+
+        _indptr[i]:_indptr[i + 1] : entries of row i
+
+        Memory is O(n + nonzero transitions), instead of O(n²).
+    """
+
+    def __init__ (self, n):
+        self.n = n
+        self.r = np.arange(0, n, dtype=int)
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._pending = [] ## [(keys, weights), ...]
+        self._indptr = np.zeros(n + 1, dtype=np.int64)
+        self._p_dirty = True
+        self._rows = {}
+        self._flat = None
+
+        self.prev = None
+
+    @property
+    def p(self):
+        """ dense (n x n) transition probabilities, for inspection only.
+        """
+        self._compile()
+        p = np.zeros((self.n, self.n), dtype=float)
+        p.flat[self._keys] = self._counts
+        return np.divide(p, np.add(np.sum(p, axis=1)[:, np.newaxis], (p == 0)))
+
+    @property
+    def nbytes(self) -> int:
+        self._compile()
+        return self._keys.nbytes + self._counts.nbytes + self._indptr.nbytes
+
+    def _compile(self):
+        """ Merges pending counts, then rebuilds row pointers.
+        """
+        if not self._p_dirty:
+            return
+
+        self._keys, self._counts = merge(self._keys, self._counts, self._pending)
+        self._indptr = np.searchsorted(self._keys, np.arange(0, self.n + 1, dtype=np.int64) * self.n)
+        self._rows = {}
+        self._flat = None
+        self._p_dirty = False
+
+    def _table(self) -> tuple:
+        if self._p_dirty:
+            self._compile()
+        if self._flat is None:
+            self._flat = (self._keys, np.cumsum(self._counts))
+        return self._flat
+
+    def _counts_arrays(self) -> dict:
+        return {'keys': self._keys, 'counts': compact(self._counts)}
+
+    def _load_counts(self, arrays: dict):
+        self._keys = arrays['keys']
+        self._counts = arrays['counts']
+        self._pending = []
+
+    def _row(self, i: int) -> tuple:
+        a, b = self._indptr[i], self._indptr[i + 1]
+        return ((self._keys[a:b] % self.n).tolist(), np.cumsum(self._counts[a:b]).tolist())
+
+    def add(self, rows, cols, weight=1):
+        keys = (np.asarray(rows, dtype=np.int64) % self.n) * self.n + (np.asarray(cols, dtype=np.int64) % self.n)
+        if keys.size:
+            self._pending.append((keys.ravel(), np.broadcast_to(np.asarray(weight, dtype=np.int64), keys.shape).ravel()))
+            self._p_dirty = True
+
+class NGramMarkos(Markos):
+    """ Order-k Markos: the next state depends on the last `order` states.
+
+        A dense order-k table would take n^(k + 1) cells, so counts are
+        kept sparse, one table per context length j = 0, ..., k: sorted
+        keys (context * n + next state), as in SparseMarkos, where a
+        context is the last j states packed in base n (most recent
+        first). Draws back off to the longest context seen in training,
+        down to plain state frequencies (j = 0). Row tables are cached
+        per context, so a draw costs O(k) dict lookups and one bisect.
+
+        >>> m = NGramMarkos(96, order=3)
+        >>> m.train(data)
+        >>> m.seed(data[-3:]) ## or a single state
+    """
+
+    def __init__ (self, n, order=2):
+        if n ** (order + 1) > np.iinfo(np.int64).max:
+            raise ValueError(f'Order {order} contexts over {n} states do not fit 64 bits')
+
+        self.n = n
+        self.order = order
+        self.r = np.arange(0, n, dtype=int)
+        self._base = [n ** j for j in range(order)]
+        self._keys = [np.zeros(0, dtype=np.int64) for _ in range(order + 1)]
+        self._counts = [np.zeros(0, dtype=np.int64) for _ in range(order + 1)]
+        self._pending = [[] for _ in range(order + 1)]
+        self._p_dirty = True
+        self._rows = {} ## (j, context) -> (next states, cumulative counts)
+        self._flat = [None] * (order + 1)
+
+        self.prev = None
+        self.history = []
+
+    @property
+    def p(self):
+        """ dense (n x n) first order transition probabilities, for inspection only.
+        """
+        self._compile()
+        p = np.zeros((self.n, self.n), dtype=float)
+        p.flat[self._keys[1]] = self._counts[1]
+        return np.divide(p, np.add(np.sum(p, axis=1)[:, np.newaxis], (p == 0)))
+
+    @property
+    def nbytes(self) -> int:
+        self._compile()
+        return sum(k.nbytes + c.nbytes for k, c in zip(self._keys, self._counts))
+
+    def _compile(self):
+        if self._p_dirty:
+            for j in range(self.order + 1):
+                self._keys[j], self._counts[j] = merge(self._keys[j], self._counts[j], self._pending[j])
+            self._rows = {}
+            self._flat = [None] * (self.order + 1)
+            self._p_dirty = False
+
+    def _table(self, j: int) -> tuple:
+        if self._p_dirty:
+            self._compile()
+        if self._flat[j] is None:
+            self._flat[j] = (self._keys[j], np.cumsum(self._counts[j]))
+        return self._flat[j]
+
+    def draw(self, history, u, first=None) -> np.ndarray:
+        """ As `Markos.draw`, backing off per chain.
+        """
+        u = np.asarray(u)
+        history = np.asarray(history, dtype=np.int64).reshape(len(u), -1)
+        states = np.zeros(len(u), dtype=np.int64)
+        todo = np.ones(len(u), dtype=bool)
+
+        for j in range(min(self.order, history.shape[1]), -1, -1):
+            known = todo.copy()
+            context = np.zeros(len(u), dtype=np.int64)
+            for i in range(1, j + 1):
+                known &= history[:, -i] >= 0
+                context += np.maximum(history[:, -i], 0) * self._base[i - 1]
+
+            x, found = search(*self._table(j), context, self.n, u, None if first is None else first)
+            found &= known
+            states[found] = x[found]
+            todo &= ~found
+            if not todo.any():
+                return states
+
+        if first is None:
+            raise ValueError('Untrained model')
+        states[todo] = np.broadcast_to(first, todo.shape)[todo]
+        return states
+
+    def _counts_arrays(self) -> dict:
+        return {
+            **{f'keys/{j}': x for j, x in enumerate(self._keys)},
+            **{f'counts/{j}': compact(x) for j, x in enumerate(self._counts)}
+        }
+
+    def _load_counts(self, arrays: dict):
+        self._keys = [arrays[f'keys/{j}'] for j in range(self.order + 1)]
+        self._counts = [arrays[f'counts/{j}'] for j in range(self.order + 1)]
+        self._pending = [[] for _ in range(self.order + 1)]
+
+    def _state(self):
+        return [int(x) for x in self.history] or None
+
+    def _row(self, key: tuple) -> tuple:
+        j, context = key
+        a, b = np.searchsorted(self._keys[j], [context * self.n, (context + 1) * self.n])
+        return ((self._keys[j][a:b] - context * self.n).tolist(), np.cumsum(self._counts[j][a:b]).tolist())
+
+    def seed(self, x):
+        """ x : state, or sequence of states (most recent last)
+        """
+        if np.ndim(x):
+            self.history = [int(i) for i in x][-self.order:]
+        else:
+            self.history = [int(x)]
+        self.prev = self.history[-1]
+
+    def train(self, data, weight=1, starts=None):
+        data = np.asarray(data, dtype=np.int64) % self.n
+        pos = positions(len(data), starts)
+        for j in range(self.order + 1):
+            t = np.flatnonzero(pos >= max(j, 1)) ## states with j predecessors
+            context = np.zeros(len(t), dtype=np.int64)
+            for i in range(1, j + 1):
+                context += data[t - i] * self._base[i - 1]
+            self._push(j, context, data[t], weight)
+
+    def add(self, rows, cols, weight=1):
+        """ First order transition counts (and their state frequencies).
+        """
+        rows = np.asarray(rows, dtype=np.int64) % self.n
+        cols = np.asarray(cols, dtype=np.int64) % self.n
+        self._push(0, np.zeros_like(cols), cols, weight)
+        self._push(1, rows, cols, weight)
+
+    def _push(self, j: int, context: np.ndarray, states: np.ndarray, weight):
+        keys = (context * self.n + states).ravel()
+        if keys.size:
+            self._pending[j].append((keys, np.broadcast_to(np.asarray(weight, dtype=np.int64), keys.shape).ravel()))
+            self._p_dirty = True
+
+    def _sample(self, first: int = 0):
+        if self._p_dirty:
+            self._compile()
+
+        h = self.history
+        contexts = [0]
+        for j in range(1, min(self.order, len(h)) + 1):
+            contexts.append(contexts[-1] + h[-j] * self._base[j - 1])
+
+        trained = False
+        for j in range(len(contexts) - 1, -1, -1): ## back off
+            key = (j, contexts[j])
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = self._row(key)
+            if row[1]:
+                trained = True
+                x = self._choose(*row, first)
+                if x is not None:
+                    return x
+
+        if not trained:
+            raise ValueError('Untrained model')
+        return None
+
+    def _step(self, x: int):
+        self.prev = x
+        self.history.append(x)
+        if len(self.history) > self.order:
+            del self.history[0]
+
 class TimeMarkos(Markos):
+    """ Durations (t : 1/2^t of a whole note) that fill bars of C.
 
-    FZERO = Fraction(0)
+        Bars are counted in integer ticks (1/TICKS of a whole note). Draws
+        are masked to the durations that still fit in the bar, looked up
+        in `fits` (ticks left -> shortest t allowed, i.e. the longest
+        duration); if none of the trained ones fits, the longest that
+        does is taken.
+    """
+
+    TICKS = 64
 
     def __init__(self, C: tuple):
         self.s = None
-        self.L = Fraction(C[0], C[1])
+        self.L = self.ticks(C)
         Markos.__init__(self, 7)
+        self.fits = self.table(self.L, self.n)
+
+    @classmethod
+    def ticks(cls, C: tuple) -> int:
+        """ bar length, in ticks
+        """
+        L = Fraction(C[0], C[1]) * cls.TICKS
+        if L.denominator != 1:
+            raise ValueError(f'Time {C} is finer than 1/{cls.TICKS}')
+        return int(L)
+
+    @classmethod
+    def table(cls, L: int, n: int) -> list:
+        """ ticks left in the bar -> first t that fits
+        """
+        return [min((t for t in range(n) if (cls.TICKS >> t) <= left), default=n) for left in range(L + 1)]
 
     def __next__(self) -> int:
         if self.s is None: ## reiniciou o compasso
-            self.s: Fraction = self.FZERO
+            self.s = 0
             return None
         else:
-            t: int = Markos.__next__(self)
-            r: Fraction = Fraction(1, pow(2, t))
-
-            while True:
-                if r + self.s == self.L: ## fecha o compasso
-                    self.s = None
-                    return t
-                elif r + self.s < self.L: ## no meio do compasso
-                    self.s = self.s + r
-                    return t
-                else: ## buscando completar o compasso
-                    t += 1
-                    r = Fraction(1, pow(2, t))
-                    continue
+            first = self.fits[self.L - self.s]
+            t = self._sample(first)
+            if t is None: ## nenhuma duração treinada cabe no compasso
+                t = first
+            self._step(t)
+
+            self.s += self.TICKS >> t
+            if self.s == self.L: ## fecha o compasso
+                self.s = None
+            return t
 
     def __iter__(self) -> int:
         while True: yield next(self)
 
+    def _state(self):
+        return {'prev': super()._state(), 's': self.s} ## and the position in the bar
+
+    def _restore(self, state):
+        super()._restore(state['prev'])
+        self.s = state['s']
+
     def basic_train(self):
         for i in range(4):
             self.train([i, 2])
@@ -87,31 +682,98 @@ class ChordMarkos(Markos):
         self.train([5, 3, 0, 4])
         self.seed(0)
 
+class NGramTimeMarkos(TimeMarkos, NGramMarkos):
+
+    def __init__(self, C: tuple, order=2):
+        self.s = None
+        self.L = self.ticks(C)
+        NGramMarkos.__init__(self, 7, order)
+        self.fits = self.table(self.L, self.n)
+
+class NGramChordMarkos(ChordMarkos, NGramMarkos):
+
+    def __init__(self, order=2):
+        NGramMarkos.__init__(self, 7, order)
+
 class _NoteMarkos(Markos):
 
     def __init__(self, octaves=8):
         self.octaves = octaves
         Markos.__init__(self, 12 * self.octaves)
 
+class _SparseNoteMarkos(SparseMarkos):
+
+    def __init__(self, octaves=8):
+        self.octaves = octaves
+        SparseMarkos.__init__(self, 12 * self.octaves)
+
+class _NGramNoteMarkos(NGramMarkos):
+
+    def __init__(self, octaves=8, order=2):
+        self.octaves = octaves
+        NGramMarkos.__init__(self, 12 * self.octaves, order)
+
 class NoteMarkos:
     """ >>> notes = NoteMarkos()
         >>> notes[chord].train(data)
         >>> notes[chord].seed(0)
+
+        octaves : note range (12 states each)
+        sparse : sparse transition counts (dense n x n matrices otherwise)
+        order : notes of context (order > 1 is always sparse)
     """
     
     MAJOR_SCALE = [0, 2, 4, 5, 7, 9, 11]
 
-    def __init__(self):
-        self._m = [_NoteMarkos(8) for _ in range(7)]
+    def __init__(self, octaves: int = 8, sparse: bool = True, order: int = 1):
+        if order > 1:
+            self._m = [_NGramNoteMarkos(octaves, order) for _ in range(7)]
+        else:
+            model = _SparseNoteMarkos if sparse else _NoteMarkos
+            self._m = [model(octaves) for _ in range(7)]
         
     def __getitem__(self, key: int):
         return self._m[key]
 
+    @property
+    def nbytes(self) -> int:
+        return sum(m.nbytes for m in self._m)
+
+    def save(self, fname: str):
+        """ see `Markos.save`
+        """
+        savez(fname, self._dump())
+
+    def load(self, fname: str, mmap: bool = True):
+        """ see `Markos.load`
+        """
+        self._undump(loadz(fname, mmap))
+        return self
+
+    def _dump(self, prefix: str = '') -> dict:
+        return {k: x for i, m in enumerate(self._m) for k, x in m._dump(f'{prefix}{i}/').items()}
+
+    def _undump(self, arrays: dict, prefix: str = ''):
+        for i, m in enumerate(self._m):
+            m._undump(arrays, f'{prefix}{i}/')
+
+    def draw(self, chords, history, u) -> np.ndarray:
+        """ Next notes of many chains, each under its own chord.
+
+            history : (chains x k) recent notes under that chord
+        """
+        chords = np.asarray(chords)
+        history = np.asarray(history, dtype=np.int64).reshape(len(chords), -1)
+        notes = np.zeros(len(chords), dtype=np.int64)
+        for key in np.unique(chords).tolist():
+            i = chords == key
+            notes[i] = self[key].draw(history[i], u[i])
+        return notes
+
     def basic_train(self):
         ## return-to-key
         for i in range(7):
-            for j in range(self[i].octaves):
-                self[i]._p[12*j:12*(j+1), 12*j + self.MAJOR_SCALE[i]] += 1
-                self[i]._p[12*j:12*(j+1), 12*j + self.MAJOR_SCALE[(i + 2) % 7]] += 1
-                self[i]._p[12*j:12*(j+1), 12*j + self.MAJOR_SCALE[(i + 4) % 7]] += 1
+            rows = np.arange(12 * self[i].octaves)
+            for k in (0, 2, 4):
+                self[i].add(rows, 12 * (rows // 12) + self.MAJOR_SCALE[(i + k) % 7])
             self[i].seed(0)
\ No newline at end of file
@@ -1,4 +1,8 @@
 from .main import main
 from .synth import Synth
 from .compiler import Compiler, parser
-from .instructions import *
\ No newline at end of file
+from .events import Events
+from .instructions import *
+from .sink import WaveSink
+from .live import LiveScore
+from .player import Player, RingBuffer, Sink, NullSink, FileSink, SimpleAudioSink
@@ -0,0 +1,150 @@
+from collections import OrderedDict
+from pathlib import Path
+import glob
+import hashlib
+import os
+import re
+
+import numpy as np
+
+from .events import Events
+
+class LRUCache:
+    """ Bounded least-recently-used cache with hit/miss counters.
+
+        size : maximum number of entries
+        nbytes : maximum total size of the cached arrays, in bytes
+    """
+
+    def __init__(self, size: int = None, nbytes: int = None):
+        self.size = size
+        self.nbytes = nbytes
+
+        self._data = OrderedDict()
+        self._nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key):
+        if key in self._data:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+        else:
+            self.misses += 1
+            return None
+
+    def put(self, key, value: np.ndarray):
+        if key in self._data:
+            self._nbytes -= self._data.pop(key).nbytes
+
+        if self.nbytes is not None and value.nbytes > self.nbytes:
+            return value ## would evict everything else
+
+        ## cached arrays are shared between callers
+        value.setflags(write=False)
+
+        self._data[key] = value
+        self._nbytes += value.nbytes
+
+        while (self.size is not None and len(self._data) > self.size) or (self.nbytes is not None and self._nbytes > self.nbytes):
+            self._nbytes -= self._data.popitem(last=False)[1].nbytes
+
+        return value
+
+    def clear(self):
+        self._data.clear()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'nbytes': self._nbytes,
+        }
+
+class CompileCache:
+    """ On-disk cache of compiled scores, like __pycache__.
+
+        Scores are stored as `Events` in a `__muscache__` directory next to
+        the source, keyed by a hash of the source text and of the compiler's
+        signature (parser and instruction table), so editing either one
+        invalidates the entry.
+
+        >>> cache = CompileCache(Compiler(parser, instructions))
+        >>> events = cache.compile('archive/tetris.mus')
+    """
+
+    dirname = '__muscache__'
+
+    def __init__(self, compiler, root: str = None):
+        self.compiler = compiler
+        self.root = root
+        self.version = compiler.signature()
+
+        self.hits = 0
+        self.misses = 0
+
+    def prefix(self, fname: str) -> str:
+        """ Entry name shared by every version of a source: its file name,
+            plus a hash of its path when `root` is shared by directories.
+        """
+        fname = Path(fname)
+        if self.root is None:
+            return fname.name
+        else:
+            return f'{fname.name}.{hashlib.sha256(str(fname.resolve()).encode()).hexdigest()[:8]}'
+
+    def path(self, fname: str, source: str) -> Path:
+        fname = Path(fname)
+        key = hashlib.sha256(f'{self.version}:{source}'.encode()).hexdigest()[:16]
+        root = fname.parent / self.dirname if self.root is None else Path(self.root)
+        return root / f'{self.prefix(fname)}.{key}.npy'
+
+    def stale(self, fname: str, path: Path) -> list:
+        """ Other versions of the entry of `fname` (exactly prefix.<key>.npy)
+        """
+        entry = re.compile(re.escape(self.prefix(fname)) + r'\.[0-9a-f]{16}\.npy')
+        return [p for p in path.parent.glob(f'{glob.escape(self.prefix(fname))}.*.npy') if entry.fullmatch(p.name) and p != path]
+
+    def compile(self, fname: str) -> Events:
+        with open(fname, 'r') as file:
+            source = file.read()
+
+        path = self.path(fname, source)
+
+        if path.exists():
+            self.hits += 1
+            return Events.load(path)
+
+        self.misses += 1
+        events = self.compiler.compile(source, events=True)
+
+        try:
+            path.parent.mkdir(exist_ok=True)
+            for stale in self.stale(fname, path):
+                stale.unlink()
+            tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp, 'wb') as file:
+                events.save(file)
+            os.replace(tmp, path)
+        except OSError: ## read-only location: compile without caching
+            pass
+
+        return events
+
+    def info(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -1,20 +1,47 @@
-from collections import deque
+import hashlib
+import sys
 
 from .parser import parser
+from .scanner import scanner
+from .events import Events
 
 class Compiler:
 
     init_key = 'INIT'
 
+    ## parser backends, by name
+    parsers = {
+        'ply' : parser,
+        'scanner' : scanner,
+    }
+
     def __init__(self, parser, instructions: dict):
+        if isinstance(parser, str):
+            parser = self.parsers[parser]
         self.parser = parser
         self.instructions = instructions
 
-        self.queue = deque([])
+        self.stack = [] ## call stack of [block, index, count] frames
         self.env = {}
 
+    def signature(self) -> str:
+        """ Hash of the parser backend and instruction table sources.
+            Compiled output cached under one signature is invalid for another.
+        """
+        h = hashlib.sha256()
+        h.update(type(self.parser).__qualname__.encode())
+        modules = {type(self.parser).__module__, __name__, Events.__module__}
+        for key in sorted(self.instructions):
+            cmd = self.instructions[key]
+            h.update(f'{key}:{cmd.__module__}.{cmd.__qualname__}'.encode())
+            modules.add(cmd.__module__)
+        for name in sorted(modules):
+            with open(sys.modules[name].__file__, 'rb') as file:
+                h.update(file.read())
+        return h.hexdigest()
+
     def reset(self):
-        self.queue.clear()
+        self.stack.clear()
         self.env.clear()
         self.init()
 
@@ -22,21 +49,57 @@ class Compiler:
         if self.init_key in self.instructions:
             self.instructions[self.init_key](self)
 
-    def compile(self, source, bytecode=False):
-        return [item for item in self._compile(source, bytecode=bytecode) if item is not None]
+    def call(self, block: tuple, count: int = 1):
+        """ Runs `block` count times, without copying it.
+        """
+        if count > 0 and block:
+            self.stack.append([block, 0, count])
+
+    def jump(self, index: int):
+        """ Continues from `index` of the top level block.
+        """
+        del self.stack[1:]
+        self.stack[0][1:] = [index, 1]
+
+    @property
+    def position(self) -> tuple:
+        """ (depth, index) of the instruction being executed.
+        """
+        return (len(self.stack), self.stack[-1][1] - 1)
+
+    def compile(self, source, bytecode=False, events=False):
+        """ events : returns columnar `Events` (for note instructions)
+        """
+        code = [item for item in self._compile(source, bytecode=bytecode) if item is not None]
+        if events:
+            return Events.from_notes(code)
+        else:
+            return code
 
     def _compile(self, source, bytecode=False):
         self.reset()
 
-        self.queue.extendleft(self.parser.parse(source))
+        code = self.parser.parse(source)
 
         if bytecode: ## intermediate code
-            while self.queue:
-                yield self.queue.pop()
+            yield from code
         else: ## exec
-            if self.init_key in self.instructions:
-                self.instructions[self.init_key](self)
-        
-            while self.queue:
-                cmd, *args = self.queue.pop()
-                yield self.instructions[cmd](self, *args)
\ No newline at end of file
+            yield from self.execute(code)
+
+    def execute(self, code: list):
+        """ Executes `code` in the current env (see `reset`).
+        """
+        self.stack.clear()
+        self.call(code)
+
+        while self.stack:
+            frame = self.stack[-1]
+            block, i, count = frame
+            if i < len(block):
+                frame[1] = i + 1
+                cmd, *args = block[i]
+                yield self.instructions[cmd](self, *args)
+            elif count > 1: ## repeat
+                frame[1:] = [0, count - 1]
+            else: ## return
+                self.stack.pop()
@@ -0,0 +1,102 @@
+import numpy as np
+
+class Events:
+    """ Columnar compiled score.
+
+        frequency : float32, NaN for rests
+        onset : float64, seconds
+        duration : float64, seconds
+        offset : int32, onset in samples at `sample_rate`
+        instrument : int16, index into the synth's instruments
+        velocity : float32, amplitude scale
+        pan : float32, NaN for the synth's pan
+
+        Columns are fields of a single structured array, which can be saved
+        with `np.save` and memory-mapped back by `Events.load`.
+
+        >>> events = compiler.compile(source, events=True)
+        >>> events.save('score.npy')
+        >>> synth.synth(Events.load('score.npy'))
+    """
+
+    dtype = np.dtype([
+        ('frequency', np.float32),
+        ('onset', np.float64),
+        ('duration', np.float64),
+        ('offset', np.int32),
+        ('instrument', np.int16),
+        ('velocity', np.float32),
+        ('pan', np.float32),
+    ])
+
+    sample_rate = 44_100
+
+    def __init__(self, data: np.ndarray, sample_rate: int = None):
+        self.data = data
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getattr__(self, key: str):
+        if key in Events.dtype.names:
+            return self.data[key]
+        raise AttributeError(key)
+
+    @property
+    def total_duration(self) -> float:
+        return float(self.onset[-1] + self.duration[-1]) if len(self) else 0.0
+
+    @classmethod
+    def from_notes(cls, notes: list, sample_rate: int = None):
+        """ [(frequency, duration), ...] or [(frequency, duration, pan), ...]
+        """
+        data = np.zeros(len(notes), dtype=cls.dtype)
+        data['frequency'] = [np.nan if note[0] is None else note[0] for note in notes]
+        data['duration'] = [note[1] for note in notes]
+        data['pan'] = [note[2] if len(note) > 2 else np.nan for note in notes]
+        data['velocity'] = 1.0
+
+        events = cls(data, sample_rate)
+        events.retime()
+        return events
+
+    def retime(self, sample_rate: int = None):
+        """ Recomputes onsets and sample offsets (cumulative durations).
+        """
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+
+        if not self.data.flags.writeable:
+            self.data = self.data.copy()
+
+        if len(self):
+            self.data['onset'][0] = 0.0
+            np.cumsum(self.duration[:-1], out=self.data['onset'][1:])
+
+            frames = (self.duration * self.sample_rate).astype(np.int64)
+            self.data['offset'][0] = 0
+            np.cumsum(frames[:-1], out=self.data['offset'][1:])
+        return self
+
+    def at(self, sample_rate: int):
+        """ Events with sample offsets at `sample_rate`.
+        """
+        if sample_rate == self.sample_rate:
+            return self
+        else:
+            return Events(self.data.copy(), sample_rate).retime()
+
+    def save(self, fname: str):
+        """ Offsets are always saved at the default `sample_rate`, so files
+            carry no rate of their own (see `load`).
+        """
+        np.save(fname, self.at(Events.sample_rate).data, allow_pickle=False)
+
+    @classmethod
+    def load(cls, fname: str, mmap: bool = True):
+        """ -> Events at the default `sample_rate` (`at` retimes them)
+        """
+        data = np.load(fname, mmap_mode=('r' if mmap else None), allow_pickle=False)
+        return cls(data, Events.sample_rate)
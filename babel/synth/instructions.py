@@ -53,31 +53,70 @@ def minor(tone):
 def major(tone):
     return MAJOR_RE.match(tone)
 
-def get_clef(tone):
-    if minor(tone):
-        tone_ = tone[:-1]
+def get_major(tone) -> str:
+    """ Major tone with the same key signature: minor tones go to their
+        relative major (root + 3 semitones), e.g. 'Am' -> 'C', 'F#m' -> 'A'.
+    """
     if major(tone):
-        tone_ = tone
-    else:
+        return tone
+    elif not minor(tone):
+        raise ValueError(f'Invalid Tone: {tone}')
+
+    root = KEYS[tone[0]] + (ACCIDENTS[tone[1:-1]] or 0) + 3
+    for key in CLEF_INDEX:
+        if (KEYS[key] - root) % 12 == 0:
+            return key
+
+    raise ValueError(f'Unsupported Tone: {tone}')
+
+def get_clef(tone):
+    return CLEF_INDEX[get_major(tone)]
+
+def get_tonic(tone) -> int:
+    """ semitones from A to the root of the tone (A for 'Am', as for 'A'):
+        training codes are measured from it. Only the key signature comes
+        from the relative major.
+    """
+    if not (major(tone) or minor(tone)):
         raise ValueError(f'Invalid Tone: {tone}')
 
-    return CLEF_INDEX[tone_]
+    return KEYS[tone[0]] + (ACCIDENTS[tone[1:].rstrip('m')] or 0)
+
+## tone -> {note name: semitones from A (octave 4)}
+TONE_TABLES = {}
+
+def get_table(tone) -> dict:
+    """ Resolves every note name (key + accident) under `tone`, once per tone.
+    """
+    if tone not in TONE_TABLES:
+        clef = get_clef(tone)
+        table = {}
+        for key, c in KEYS.items():
+            for acc, b in ACCIDENTS.items():
+                if b is None:
+                    b = ACCIDENTS[clef[key]] if key in clef else 0
+                table[key + acc] = c + b
+        TONE_TABLES[tone] = table
+    return TONE_TABLES[tone]
 
 def cmd_init(compiler: Compiler):
     """
     """
     compiler.env['tone'] = 'C'
+    compiler.env['notes'] = get_table('C')
+    compiler.env['tonic'] = get_tonic('C')
     compiler.env['time'] = (4, 4)
     compiler.env['freq'] = 440.0
     compiler.env['tempo'] = 120
     return None
 
-def cmd_rel_note(compiler: Compiler, note: str, duration: int, dot: None) -> (int, int):
+def cmd_rel_note(compiler: Compiler, note: tuple, duration: int, dot: None) -> (int, int):
     """ note, duration, dot -> frequency(Hz), lenght(s)
     """
+    if note is None: return None ## Pause: nothing to learn from
     if duration is None:
         duration = compiler.env['time'][1]
-    n = get_note(compiler, note) - KEYS[compiler.env['tone']]
+    n = get_note(compiler, note) - compiler.env['tonic']
     t = int(log2(duration))
     return (n, t)
 
@@ -87,32 +126,23 @@ def get_duration(compiler: Compiler, duration: int) -> int:
 
     return (compiler.env['time'][1] / duration) * (60.0 / compiler.env['tempo'])
 
-def get_note(compiler: Compiler, note: str) -> int:
-    m = NOTE_RE.match(note)
-
-    if m is None: return None ## Pause
-
-    key = m.group(1)
-    acc = m.group(2)
-    ocv = m.group(3)
+def get_note(compiler: Compiler, note: tuple) -> int:
+    """ note : (key, octave) from the parser, e.g. ('C#', 4); None for pause
+    """
+    if note is None: return None ## Pause
 
-    clef = get_clef(compiler.env['tone'])
+    if isinstance(note, str): ## formatted note, e.g. 'C#4'
+        m = NOTE_RE.match(note)
 
-    c = KEYS[key]
+        if m is None: return None ## Pause
 
-    if acc == '':
-        if key in clef:
-            b = ACCIDENTS[clef[key]]
-        else:
-            b = 0
-    else:
-        b = ACCIDENTS[acc]
+        note = (m.group(1) + m.group(2), int(m.group(3)))
 
-    a = (int(ocv) - 4)
+    key, ocv = note
 
-    return (12 * a + b + c)
+    return 12 * (ocv - 4) + compiler.env['notes'][key]
 
-def cmd_note(compiler: Compiler, note: str, duration, dot):
+def cmd_note(compiler: Compiler, note: tuple, duration, dot):
     """ note, duration, dot -> frequency(Hz), lenght(s)
     """
 
@@ -133,6 +163,8 @@ def cmd_tone(compiler: Compiler, tone):
     """
     """
     compiler.env['tone'] = tone
+    compiler.env['notes'] = get_table(tone)
+    compiler.env['tonic'] = get_tonic(tone)
     return None
 
 def cmd_time(compiler: Compiler, a: int, b: int):
@@ -141,10 +173,32 @@ def cmd_time(compiler: Compiler, a: int, b: int):
     compiler.env['time'] = (a, b)
     return None
 
-def cmd_rept(compiler: Compiler, code: tuple):
+def cmd_rept(compiler: Compiler, code: tuple, count: int = 2):
+    """
     """
+    compiler.call(code, count)
+    return None
+
+def cmd_sign(compiler: Compiler, sign: str):
+    """ Dal Segno al Coda, on the top level of the score:
+        % : segno; the next % jumps back to it (once)
+        @ : "to coda"; after the jump back, skips to the next @ (the coda)
     """
-    compiler.queue.extendleft(code + code)
+    depth, index = compiler.position
+
+    if depth != 1:
+        raise SyntaxError(f'Sign {sign} inside a repeat')
+
+    code = compiler.stack[0][0]
+    signs = [i for i, (cmd, *args) in enumerate(code) if cmd == 'SIGN' and args[0] == sign]
+
+    if sign == '%':
+        if signs.index(index) == 1 and not compiler.env.get('segno'):
+            compiler.env['segno'] = True
+            compiler.jump(signs[0] + 1)
+    elif sign == '@':
+        if signs.index(index) == 0 and compiler.env.get('segno'):
+            compiler.jump(signs[1] + 1 if len(signs) > 1 else len(code))
     return None
 
 def cmd_tempo(compiler: Compiler, tempo: int):
@@ -153,14 +207,16 @@ def cmd_tempo(compiler: Compiler, tempo: int):
     compiler.env['tempo'] = tempo
     return None
 
-def cmd_chord(compiler: Compiler, chord: str):
-    m = CHORD_RE.match(chord)
+def cmd_chord(compiler: Compiler, chord: str, quality: str = None):
+    """ chord : key, e.g. 'F#' (or formatted chord, e.g. 'F#m', without quality)
+    """
+    if quality is None:
+        m = CHORD_RE.match(chord)
 
-    key = m.group(1)
-    acc = m.group(2)
-    qua = m.group(3)
+        chord = m.group(1) + m.group(2)
+        quality = m.group(3)
 
-    n = (KEYS[key] - KEYS[compiler.env['tone']]) % 12
+    n = (KEYS[chord[0]] - compiler.env['tonic']) % 12
 
     if n in CHORD_KEYS:
         return (CHORD_KEYS[n], None)
@@ -177,5 +233,6 @@ instructions = {
     'TONE' : cmd_tone,
     'TIME' : cmd_time,
     'REPT' : cmd_rept,
+    'SIGN' : cmd_sign,
     'TEMPO' : cmd_tempo
 }
\ No newline at end of file
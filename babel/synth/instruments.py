@@ -1,30 +1,93 @@
 import numpy as np
 
+from .cache import LRUCache
+
 PI = np.pi
 TWO_PI = 2.0 * PI
 
 class WaveShape:
+    """ Waveforms sampled in time are in `Oscillator`, over accumulated phase.
+    """
 
     @classmethod
-    def sine(cls, t: np.ndarray, f: float, df: float=0.0):
-        return np.sin(np.multiply(np.multiply(TWO_PI, np.add(f, df)), t))
+    def noise(cls, n: int, a:float=0.001):
+        return np.random.normal(loc=0.0, scale=a, size=n)
 
-    @classmethod
-    def saw(cls, t: np.ndarray, f: float, df: float=0.0):
-        T = np.multiply(np.add(f, df), t)
-        return np.multiply(2.0, np.subtract(T, np.floor(np.add(0.5, T))))
+class Oscillator:
+    """ Per-voice phase accumulator.
 
-    @classmethod
-    def square(cls, t: np.ndarray, f: float, df: float=0.0):
-        w = np.sin(np.multiply(np.multiply(TWO_PI, np.add(f, df)), t))
-        return np.piecewise(w, [w < 0.0, w == 0.0,  w > 0.0], [-1.0, 0.0, 1.0])
+        Phase is counted in cycles from the voice onset and wrapped to [0, 1),
+        so precision is the same at the start and at the end of long renders.
+    """
 
-    @classmethod
-    def noise(cls, n: int, a:float=0.001):
-        return np.random.normal(loc=0.0, scale=a, size=n)
+    def __init__(self, n: int, rate: float):
+        """ n : frame length
+            rate : sample rate
+        """
+        self.n = n
+        self.rate = rate
+        self.r = np.arange(n, dtype=float)
+
+    def phase(self, f: float, df: np.ndarray=None):
+        """ f : frequency
+            df : frequency deviation (per sample)
+
+            Unwrapped phase, in cycles; the waveforms wrap it.
+        """
+        if df is None or np.isscalar(df):
+            return np.multiply((f if df is None else f + df) / self.rate, self.r)
+        else:
+            p = np.multiply(f / self.rate, self.r)
+            p += self.integral(df)
+            return p
+
+    def integral(self, df: np.ndarray):
+        """ Cumulative phase deviation, in cycles, of a per sample deviation.
+        """
+        p = np.zeros(self.n, dtype=float)
+        if self.n:
+            np.cumsum(df[:-1], out=p[1:])
+            p /= self.rate
+        return p
+
+    def sine(self, f: float, df: np.ndarray=None):
+        return self._sine(self.phase(f, df))
+
+    def saw(self, f: float, df: np.ndarray=None):
+        return self._saw(self.phase(f, df))
+
+    def square(self, f: float, df: np.ndarray=None):
+        return self._square(self.phase(f, df))
+
+    ## Waveforms, evaluated in place over phase arrays of any shape
+    @staticmethod
+    def _sine(x: np.ndarray):
+        x -= np.floor(x)
+        x *= TWO_PI
+        return np.sin(x, out=x)
+
+    @staticmethod
+    def _saw(x: np.ndarray):
+        ## 2 (x - floor(x + 1/2)) = 2 frac(x + 1/2) - 1
+        x += 0.5
+        x -= np.floor(x)
+        x *= 2.0
+        x -= 1.0
+        return x
+
+    @staticmethod
+    def _square(x: np.ndarray):
+        x -= np.floor(x)
+        z = (x == 0.0)
+        np.sign(np.subtract(0.5, x, out=x), out=x)
+        x[z] = 0.0
+        return x
 
 class WaveEnvelope:
 
+    ## envelope curves, shared by every envelope
+    cache = LRUCache(size=256)
+
     def __init__(self,
         attack_time: float,
         decay_time: float,
@@ -54,6 +117,24 @@ class WaveEnvelope:
 
         return (i, min(k, n))
 
+    def curve(self, d: float, n: int, rate: float) -> np.ndarray:
+        """ d : duration
+            n : frame length
+            rate : sample rate
+
+            Memoized envelope over n samples from the note onset.
+            The returned array is read-only.
+        """
+        key = (self.attack_time, self.decay_time, self.release_time, self.sustain_amp, d, n, rate)
+
+        c = self.cache.get(key)
+
+        if c is None:
+            c = np.broadcast_to(self.envelope(np.arange(n, dtype=float) / rate, d), (n,)).copy()
+            c = self.cache.put(key, c)
+
+        return c
+
     def envelope(self, tf: np.ndarray, d: float):
         if tf.shape[0] == 0: return 0.0
 
@@ -132,49 +213,140 @@ class Instrument(metaclass=MetaInstrument):
 
     VOICE = [(1, 1.0)]
 
+    ## [(waveform, frequency ratio, tremolo amplitude), ...]
+    PARTIALS = None
+
+    TREMOLO_RATE = 4.0
+
+    ## rendered notes, shared by every instrument
+    cache = LRUCache(nbytes=64 << 20)
+
+    ## whether rendered notes are deterministic (and may be cached)
+    cacheable = True
+
+    ## PARTIALS rendered as one batch (False: one harmonic at a time,
+    ## through `shape`, as a reference for `partials`)
+    batched = True
+
+    ## samples per batch of partials
+    CHUNK = 4096
+
     __scs__ = {}
 
     def __init__(self, envelope: WaveEnvelope, **kwargs):
         self.env = envelope
 
-    def touch(self, f: float, d: float, t:np.ndarray, w: np.ndarray, i: int, j: int, n: int):
+        if 'cache' in kwargs:
+            self.cacheable = bool(kwargs['cache'])
+
+        if 'batched' in kwargs:
+            self.batched = bool(kwargs['batched'])
+
+        self._scratch = np.empty((0, self.CHUNK), dtype=float)
+
+    def subframe(self, d: float, i: int, j: int, n: int):
+        """ Frame boundaries for a note, including envelope release.
+        """
+        return self.env.subframe(d, i, j, n)
+
+    def render(self, f: float, d: float, n: int, rate: float) -> np.ndarray:
         """ f : frequency
             d : duration
-            t : time frame 
-            w : wave frame
-            i : subframe start
-            j : subframe end
-            n : frame end
+            n : frame length (note onset to release end)
+            rate : sample rate
+
+            Renders a single note into its own buffer, so that notes never
+            share (and rescale) each other's samples. Notes are cached before
+            effects; cached buffers are read-only.
         """
-        ## get frame boundaries
-        i, j = self.env.subframe(d, i, j, n)
+        if self.cacheable:
+            key = (type(self), self.env, self.batched, f, d, n, rate)
+            w = self.cache.get(key)
+            if w is None:
+                w = self.cache.put(key, self._render(f, d, n, rate))
+        else:
+            w = self._render(f, d, n, rate)
+
+        if type(self).effects.__func__ is not Instrument.effects.__func__:
+            ## effects (e.g. noise) are applied after the cache
+            if not w.flags.writeable:
+                w = w.copy()
+            self.effects(w, 0, n, n)
+
+        return w
+
+    def _render(self, f: float, d: float, n: int, rate: float) -> np.ndarray:
+        osc = Oscillator(n, rate)
+        if self.PARTIALS is None or not self.batched:
+            w = np.zeros(n, dtype=float)
+            for k, h in self.harmonics(f):
+                w += h * self.shape(osc, f, k)
+        else:
+            w = self.partials(osc, f)
 
-        if i >= j:
-            print(f'i={i} j ={j} d={d}')
+        w *= self.env.curve(d, n, rate)
 
-        ## get time frame
-        tf = t[i:j]
-        for k, h in self.harmonics(f):
-            w[i:j] += h * self.shape(tf, f, k)
-        else:
-            w[i:j] *= self.env.envelope(tf, d)
+        return w
 
-        self.effects(w, i, j, n)
+    def partials(self, osc: Oscillator, f: float) -> np.ndarray:
+        """ Weighted sum of every (harmonic x partial) voice.
+
+            Voices sharing a waveform are evaluated together as a 2-D
+            (voices x samples) block in a scratch buffer that is reused
+            across notes, CHUNK samples at a time.
+        """
+        k, h = map(np.array, zip(*self.harmonics(f)))
+
+        groups = []
+        for wave in dict.fromkeys(wave for wave, _, _ in self.PARTIALS):
+            r, a = map(np.array, zip(*[(r, a) for w, r, a in self.PARTIALS if w == wave]))
+            groups.append((
+                getattr(Oscillator, f'_{wave}'),
+                np.multiply.outer(r, k).ravel() * (f / osc.rate), ## phase step
+                np.repeat(a, k.shape[0]), ## tremolo
+                np.tile(h, r.shape[0]) ## weight
+            ))
+
+        if any(np.any(a) for _, _, a, _ in groups):
+            I = osc.integral(osc.sine(self.TREMOLO_RATE))
+        else:
+            I = None
+
+        m = max(F.shape[0] for _, F, _, _ in groups)
+        if self._scratch.shape[0] < m:
+            self._scratch = np.empty((m, self.CHUNK), dtype=float)
+
+        w = np.zeros(osc.n, dtype=float)
+        for i in range(0, osc.n, self.CHUNK):
+            j = min(i + self.CHUNK, osc.n)
+            for kernel, F, A, H in groups:
+                x = self._scratch[:F.shape[0], :j - i]
+                np.multiply(F[:, np.newaxis], osc.r[np.newaxis, i:j], out=x)
+                if I is not None:
+                    x += np.multiply.outer(A, I[i:j])
+                w[i:j] += H @ kernel(x)
+        return w
 
     @classmethod
     def effects(cls, w: np.ndarray, i: int, j: int, n: int):
         return None
 
     @classmethod
-    def tremolo(cls, t: np.ndarray, a: float=0.0, b: float=4.0):
+    def tremolo(cls, osc: Oscillator, a: float=0.0, b: float=None):
         if a == 0.0:
             return 0.0
         else:
-            return a * np.sin(TWO_PI * b * (t - t[0]))
+            return a * osc.sine(cls.TREMOLO_RATE if b is None else b)
 
     @classmethod
-    def shape(cls, t: np.ndarray, f: float, k: int):
-        raise NotImplementedError
+    def shape(cls, osc: Oscillator, f: float, k: int):
+        """ k-th harmonic of f, summed over PARTIALS (instruments without
+            PARTIALS override this instead)
+        """
+        if cls.PARTIALS is None:
+            raise NotImplementedError
+        else:
+            return sum(getattr(osc, wave)(r * f * k, cls.tremolo(osc, a)) for wave, r, a in cls.PARTIALS)
 
     @classmethod
     def harmonics(cls, f: float):
@@ -189,9 +361,9 @@ class Instrument(metaclass=MetaInstrument):
         return [kh for kh in enumerate(h, 1)]
 
     @classmethod
-    def get(cls, key: str):
+    def get(cls, key: str, **kwargs):
         subcls = cls.__scs__[key]
-        return subcls(**subcls.kwargs)
+        return subcls(**{**subcls.kwargs, **kwargs})
 
 class Violin(Instrument, metaclass=MetaInstrument):
 
@@ -213,9 +385,10 @@ class Violin(Instrument, metaclass=MetaInstrument):
         'envelope' : ENVELOPE
     }
 
-    @classmethod
-    def shape(cls, t: np.ndarray, f: float, k: int):
-        return WaveShape.saw(t, f * k, cls.tremolo(t, 0.001)) + WaveShape.sine(t, pow(2, -5/12)* f * k, cls.tremolo(t, 0.001))
+    PARTIALS = [
+        ('saw', 1.0, 0.001),
+        ('sine', pow(2, -5/12), 0.001),
+    ]
 
     @classmethod
     def harmonics(cls, f: float):
@@ -245,13 +418,13 @@ class Synth(Instrument, metaclass=MetaInstrument):
         'envelope' : ENVELOPE
     }
 
-    @classmethod
-    def shape(cls, t: np.ndarray, f: float, k: int):
-        return (WaveShape.saw(t, f * k) +
-                WaveShape.saw(t, pow(2, -5/12) * f * k) +
-                WaveShape.saw(t, pow(2, -17/12) * f * k) +
-                WaveShape.saw(t, pow(2, -2) * f * k) + 
-                WaveShape.saw(t, pow(2, -1) * f * k))
+    PARTIALS = [
+        ('saw', 1.0, 0.0),
+        ('saw', pow(2, -5/12), 0.0),
+        ('saw', pow(2, -17/12), 0.0),
+        ('saw', pow(2, -2), 0.0),
+        ('saw', pow(2, -1), 0.0),
+    ]
 
     @classmethod
     def harmonics(cls, f: float):
@@ -274,10 +447,10 @@ class Harmonica(Instrument, metaclass=MetaInstrument):
         'envelope' : ENVELOPE
     }
 
-    @classmethod
-    def shape(cls, t: np.ndarray, f: float, k: int):
-        return (WaveShape.square(t, f * k, cls.tremolo(t, a=0.025)) +
-                WaveShape.square(t, pow(2, 8.0/12.0) * f * k, 0.0))
+    PARTIALS = [
+        ('square', 1.0, 0.025),
+        ('square', pow(2, 8.0/12.0), 0.0),
+    ]
 
     @classmethod
     def effects(cls, w, i, j, n):
@@ -0,0 +1,248 @@
+""" Incremental recompilation and rendering, for live editing.
+
+    >>> live = LiveScore(Compiler(scanner, instructions), Synth())
+    >>> live.update(source)         ## full compile and render
+    >>> live.update(edited_source)  ## only what changed
+    >>> live.audio()
+"""
+import numpy as np
+
+from .events import Events
+from .scanner import Scanner, scanner
+
+class LiveScore:
+    """ A score kept compiled and rendered across edits of its source.
+
+        source -> tokens : only the edited region is lexed again;
+        tokens -> code   : parsed again (linear, cheap);
+        code -> notes    : execution resumes from the last env checkpoint
+                           (TIME, TEMPO, TONE state) before the first changed
+                           top level instruction, and stops as soon as it
+                           reaches a checkpoint past the edit with the same
+                           env as before: later notes are reused;
+        notes -> wave    : only the frames of changed notes (and of the
+                           notes overlapping them) are mixed again into a
+                           persistent, unnormalized float buffer.
+
+        Scores with signs (%, @) jump around, so they are always executed
+        from the start (rendering is still incremental).
+    """
+
+    ## top level instructions between env checkpoints
+    checkpoint = 64
+
+    def __init__(self, compiler, synth, **kwargs):
+        if 'checkpoint' in kwargs:
+            self.checkpoint = max(1, int(kwargs['checkpoint']))
+
+        self.compiler = compiler
+        self.synth = synth
+
+        if isinstance(compiler.parser, Scanner):
+            self.scanner = compiler.parser
+        else: ## same intermediate code as the PLY parser
+            self.scanner = scanner
+
+        self.source = ''
+        self.tokens = []
+        self.code = []
+        self.notes = []
+        self.checkpoints = {} ## top level index -> (env, number of notes)
+        self.events = Events.from_notes([], synth.sample_rate)
+        self.wave = synth._zeros(0)
+
+        ## encoded wave, kept in sync with the buffer: frames [a, b) need encoding
+        self.pcm = bytearray()
+        self.peaks = np.zeros(0) ## per `synth.block` frames
+        self.peak = 0.0
+        self.dirty = (0, 0)
+
+        ## instruments never sound longer than (attack + decay + release) past the note end
+        self.reach = max(
+            int((i.env.attack_time + i.env.decay_time + i.env.release_time) * synth.sample_rate) + 1
+            for i in synth.instruments
+        )
+
+    def update(self, source: str):
+        """ Recompiles and re-renders `source`, an edit of the current one.
+            Returns the re-rendered frame range (a, b), or None if nothing
+            changed. On errors, the previous state is kept.
+        """
+        if source == self.source and self.code:
+            return None
+
+        tokens = self.scanner.relex(self.source, self.tokens, source)
+        code = self.scanner.parse(source, tokens)
+        notes, checkpoints = self._execute(code)
+        events = Events.from_notes(notes, self.synth.sample_rate)
+
+        a, b = self._render(events)
+
+        self.source = source
+        self.tokens = tokens
+        self.code = code
+        self.notes = notes
+        self.checkpoints = checkpoints
+        self.events = events
+
+        return (a, b)
+
+    def _execute(self, code: list):
+        """ code -> (notes, checkpoints), reusing the previous execution.
+        """
+        compiler = self.compiler
+        old = self.code
+
+        if any(cmd == 'SIGN' for cmd, *_ in code):
+            compiler.reset()
+            return ([x for x in compiler.execute(code) if x is not None], {})
+
+        ## top level instructions old[d:e - shift] were changed into code[d:e]
+        m = min(len(old), len(code))
+        d = 0
+        while d < m and old[d] == code[d]:
+            d += 1
+        t = 0
+        while t < m - d and old[-1 - t] == code[-1 - t]:
+            t += 1
+        e = len(code) - t
+        shift = len(code) - len(old)
+
+        starts = [i for i in self.checkpoints if i <= d]
+        if starts:
+            k = max(starts)
+            env, count = self.checkpoints[k]
+            compiler.reset()
+            compiler.env.clear()
+            compiler.env.update(env)
+            notes = self.notes[:count]
+            checkpoints = {i: c for i, c in self.checkpoints.items() if i <= k}
+        else:
+            k = 0
+            compiler.reset()
+            notes = []
+            checkpoints = {}
+
+        last = k
+        for i in range(k, len(code)):
+            if i >= e and (i - shift) in self.checkpoints: ## past the edit
+                env, count = self.checkpoints[i - shift]
+                if env == compiler.env: ## resync: the rest is unchanged
+                    n = len(notes) - count
+                    notes.extend(self.notes[count:])
+                    checkpoints.update(
+                        (j + shift, (env, c + n)) for j, (env, c) in self.checkpoints.items() if j >= i - shift
+                    )
+                    return (notes, checkpoints)
+
+            if i == k or i - last >= self.checkpoint:
+                checkpoints[i] = (dict(compiler.env), len(notes))
+                last = i
+
+            notes.extend(x for x in compiler.execute([code[i]]) if x is not None)
+
+        return (notes, checkpoints)
+
+    def _render(self, events: Events):
+        """ Mixes changed notes into the wave buffer -> changed frames (a, b)
+        """
+        synth = self.synth
+        old = self.events
+
+        n0 = self.wave.shape[0]
+        n1 = int(events.total_duration * synth.sample_rate)
+
+        x = old.data.view(np.dtype((np.void, old.data.dtype.itemsize)))
+        y = events.data.view(np.dtype((np.void, events.data.dtype.itemsize)))
+        m = min(len(x), len(y))
+
+        ## rows [p, len - s) changed
+        diff = np.flatnonzero(x[:m] != y[:m])
+        p = int(diff[0]) if len(diff) else m
+        diff = np.flatnonzero(x[::-1][:m - p] != y[::-1][:m - p])
+        s = int(diff[0]) if len(diff) else m - p
+
+        if p == len(x) == len(y) and n0 == n1:
+            return (n1, n1)
+
+        ## first changed frame, in both versions
+        a = min([n1, *old.offset[p:p + 1].tolist(), *events.offset[p:p + 1].tolist()])
+
+        if n0 == n1: ## up to the release end of changed notes
+            b = a
+            for e, q in ((old, len(x) - s), (events, len(y) - s)):
+                if q > p:
+                    b = max(b, int(e.offset[q - 1] + e.duration[q - 1] * synth.sample_rate) + self.reach)
+            b = min(b, n1)
+        else: ## notes clamp their release to the end of the song
+            a = max(0, min(a, n1 - self.reach))
+            b = n1
+            wave = synth._zeros(n1)
+            wave[:min(a, n0)] = self.wave[:min(a, n0)]
+            self.wave = wave
+
+        w = self.wave[a:b]
+        w[...] = 0.0
+        self._invalidate(a, b)
+
+        ## every note sounding in [a, b)
+        ends = events.offset + (events.duration * synth.sample_rate).astype(np.int64)
+        lo = int(np.searchsorted(ends, a - self.reach, side='right'))
+        hi = int(np.searchsorted(events.offset, b, side='left'))
+
+        for frequency, duration, instrument, velocity, pan, i, j in synth._frames(Events(events.data[lo:hi], synth.sample_rate)):
+            if frequency != frequency: continue ## NaN: pause
+            synth._add(w, a, *synth._note(frequency, duration, instrument, velocity, pan, i, j, n1))
+
+        self._measure(a, b)
+
+        return (a, b)
+
+    def _measure(self, a: int, b: int):
+        """ Updates block peaks over frames [a, b)
+        """
+        block = self.synth.block
+        n = -(-self.wave.shape[0] // block)
+        if n != len(self.peaks):
+            self.peaks = np.resize(self.peaks, n)
+            b = self.wave.shape[0]
+
+        i, j = a // block, -(-b // block)
+        if i < j:
+            w = np.abs(self.wave[i * block:j * block])
+            if w.ndim > 1:
+                w = w.max(axis=1)
+            self.peaks[i:j] = np.maximum.reduceat(w, np.arange(0, w.shape[0], block))
+
+    def _invalidate(self, a: int, b: int):
+        x, y = self.dirty
+        self.dirty = (a, b) if x == y else (min(a, x), max(b, y))
+
+    def audio(self) -> bytearray:
+        """ Normalized, encoded PCM of the whole score.
+
+            Only frames changed since the last call are encoded again,
+            unless the peak (hence the normalization) changed.
+        """
+        synth = self.synth
+        n = self.wave.shape[0]
+        size = synth.channels * (synth.bits // 8) ## bytes per frame
+        peak = np.max(self.peaks, initial=0.0)
+
+        valid = min(len(self.pcm) // size, n)
+        x, y = self.dirty
+        if peak != self.peak:
+            a, b = 0, n
+        elif x == y:
+            a, b = valid, n
+        else:
+            a, b = min(x, valid), (n if valid < n else y)
+
+        del self.pcm[n * size:]
+        self.pcm.extend(bytes(n * size - len(self.pcm)))
+        self.pcm[a * size:b * size] = synth._encode(synth._normalize(self.wave[a:b], peak))
+
+        self.peak = peak
+        self.dirty = (0, 0)
+
+        return self.pcm
@@ -1,24 +1,213 @@
 #!/usr/bin/env python3
+from contextlib import contextmanager, ExitStack
+
+def compile_source(fname: str, cache=None):
+    """ Compiles a source file to events.
+
+        cache : CompileCache, or None to always compile
+    """
+    from .compiler import Compiler
+    from .parser import parser
+    from .instructions import instructions
+
+    if cache is not None:
+        return cache.compile(fname)
+
+    with open(fname, 'r') as file:
+        source = file.read()
+
+    compiler = Compiler(parser, instructions)
+    return compiler.compile(source, events=True)
+
+def render(events, synth_params: dict):
+    """ Renders compiled events to normalized float samples.
+    """
+    import numpy as np
+    from .synth import Synth
+
+    synth = Synth(**synth_params)
+    return np.concatenate([synth._zeros(0), *synth._stream(events)])
+
+def render_shared(fname: str, synth_params: dict, cached: bool = True, root: str = None):
+    """ Worker: compiles a source file (through the on-disk compile cache
+        at `root`, shared by every process, unless cached=False), then
+        renders it into a shared memory block, so samples are not pickled
+        back to the parent. The caller owns (and must unlink) it.
+    """
+    from multiprocessing import shared_memory, resource_tracker
+    import numpy as np
+    from .cache import CompileCache
+    from .compiler import Compiler
+    from .parser import parser
+    from .instructions import instructions
+
+    cache = CompileCache(Compiler(parser, instructions), root) if cached else None
+
+    w = render(compile_source(fname, cache), synth_params)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, w.nbytes))
+    np.ndarray(w.shape, dtype=w.dtype, buffer=shm.buf)[...] = w
+    shm.close()
+
+    ## ownership goes to the parent: don't let this worker's tracker unlink it
+    resource_tracker.unregister(shm._name, 'shared_memory')
+
+    return (shm.name, w.shape, w.dtype.str, None if cache is None else cache.info())
+
+@contextmanager
+def render_all(scores: list, synth_params: dict, jobs: int = 1, pan: list = None, cache=None):
+    """ Renders every score, in order, as a track of normalized float blocks.
+
+        scores : compiled Events (jobs = 1), or source file names, compiled
+                 by the workers (jobs > 1)
+        pan : per source pan (defaults to the synth's)
+        cache : CompileCache whose location the workers share (and whose
+                counters they update), or None to always compile
+
+        Serial tracks are rendered lazily, as they are mixed; parallel ones
+        are compiled and rendered up front into shared memory, released
+        on exit.
+    """
+    from .synth import Synth
+
+    if pan is None:
+        params = [synth_params] * len(scores)
+    else:
+        params = [{**synth_params, 'pan': p} for p in pan]
+
+    if jobs <= 1:
+        yield [Synth(**p)._stream(events) for events, p in zip(scores, params)]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import shared_memory
+        import numpy as np
+
+        cached = [cache is not None] * len(scores)
+        root = [None if cache is None else cache.root] * len(scores)
+
+        with ProcessPoolExecutor(max_workers=jobs) as pool, ExitStack() as stack:
+            tracks = []
+            for name, shape, dtype, info in pool.map(render_shared, scores, params, cached, root):
+                shm = shared_memory.SharedMemory(name=name)
+                stack.callback(shm.unlink)
+                stack.callback(shm.close)
+                tracks.append([np.ndarray(shape, dtype=dtype, buffer=shm.buf)])
+                if info is not None:
+                    cache.hits += info['hits']
+                    cache.misses += info['misses']
+            yield tracks
+            del tracks
+
+def watch(argc: int, argv: list):
+    """ watch source.mus [-o output.wav]: re-renders `source` on every save.
+    """
+    import argparse
+    import os
+    import sys
+    import time
+    from .compiler import Compiler
+    from .live import LiveScore
+    from .scanner import scanner
+    from .synth import Synth
+    from .instructions import instructions
+
+    argparser = argparse.ArgumentParser(prog=f"{argv[0]} watch", description="Re-renders a source file whenever it is saved.")
+
+    argparser.add_argument('-o', '--output', type=str, default=None, help="Sets output destination (defaults to the source name).")
+    argparser.add_argument('-i', '--instrument', type=str, default="synth", help="Selects instrument.")
+    argparser.add_argument('-r', '--rate', type=int, default=44_100, help="Sets sample rate.")
+    argparser.add_argument('-b', '--bits', type=int, default=16, choices=[8, 16, 24, 32], help="Sets encoding bits.")
+    argparser.add_argument('-c', '--channels', type=int, default=1, help="Sets number of channels.")
+    argparser.add_argument('-t', '--interval', type=float, default=0.1, help="Sets the polling interval, in seconds.")
+    argparser.add_argument('source', help="Provides Input file")
+
+    args = argparser.parse_args(argv[2:argc])
+
+    if args.output is None:
+        wname = f"{os.path.splitext(args.source)[0]}.wav"
+    elif args.output.endswith('.wav'):
+        wname = args.output
+    else:
+        wname = f"{args.output}.wav"
+
+    synth = Synth(sample_rate=args.rate, instrument=args.instrument, bits=args.bits, channels=args.channels)
+    live = LiveScore(Compiler(scanner, instructions), synth)
+
+    print(f"watching {args.source} -> {wname} (Ctrl+C to stop)", file=sys.stderr)
+
+    mtime = None
+    try:
+        while True:
+            try:
+                stat = os.stat(args.source)
+            except FileNotFoundError: ## editors may replace the file on save
+                stat = None
+
+            if stat is None or stat.st_mtime_ns == mtime:
+                time.sleep(args.interval)
+                continue
+
+            mtime = stat.st_mtime_ns
+            start = time.perf_counter()
+
+            with open(args.source, 'r') as file:
+                source = file.read()
+
+            try:
+                frames = live.update(source)
+            except (SyntaxError, ValueError, KeyError) as error:
+                print(f"{args.source}: {error}", file=sys.stderr)
+                continue
+
+            if frames is None:
+                continue
+
+            synth.wave(wname, live.audio())
+
+            a, b = frames
+            rate = synth.sample_rate
+            elapsed = time.perf_counter() - start
+            latency = time.time() - mtime / 1e9 ## since the save
+            print(
+                f"{args.source}: rendered {a / rate:.2f}s-{b / rate:.2f}s of {live.wave.shape[0] / rate:.2f}s "
+                f"in {1e3 * elapsed:.1f} ms ({1e3 * latency:.1f} ms after save)",
+                file=sys.stderr
+            )
+    except KeyboardInterrupt:
+        pass
 
 def main(argc: int, argv: list):
     from pathlib import Path
     import argparse
+    import sys
+    from .cache import CompileCache
     from .compiler import Compiler
     from .parser import parser
     from .synth import Synth
     from .instructions import instructions
 
+    if argc > 1 and argv[1] == 'watch':
+        return watch(argc, argv)
+
     argparser = argparse.ArgumentParser(description="Sound Compiler & Synth")
 
     argparser.add_argument('-o', '--output', type=str, default="music.wav", help="Sets output destination.")
     argparser.add_argument('-i', '--instrument', type=str, default="synth", help="Selects instrument.")
     argparser.add_argument('-r', '--rate', type=int, default=44_100, help="Sets sample rate.")
     argparser.add_argument('-b', '--bits', type=int, default=16, choices=[8, 16, 24, 32], help="Sets encoding bits.")
+    argparser.add_argument('-c', '--channels', type=int, default=1, help="Sets number of channels.")
+    argparser.add_argument('-p', '--pan', type=float, nargs="+", default=None, help="Pans each source, from -1.0 (left) to 1.0 (right).")
+    argparser.add_argument('-j', '--jobs', type=int, default=1, help="Renders sources in N parallel processes.")
+    argparser.add_argument('--no-cache', action='store_true', help="Always recompiles sources.")
+    argparser.add_argument('-v', '--verbose', action='store_true', help="Reports compile cache hits.")
     argparser.add_argument('source', nargs="+", help="Provides Input files")
 
     # parser.add_argument("source", help="Source files with .mus extension.")
     args = argparser.parse_args(argv[1:argc])
 
+    if args.pan is not None and len(args.pan) != len(args.source):
+        argparser.error("--pan takes one value per source.")
+
     synth_params = {
         ## These may come from CLI parsing
         ## Nothing else to do here right now
@@ -28,30 +217,44 @@ def main(argc: int, argv: list):
 
         ## Instrument
         'instrument' : args.instrument,
+
+        ## encoding bits
+        'bits' : args.bits,
+
+        ## channels
+        'channels' : args.channels,
     }
 
-    compiler = Compiler(parser, instructions)
-    synth = Synth(**synth_params)
-    audio_list = []
-    for fname in args.source:
-        with open(fname, 'r') as file:
-            source = file.read()
-        notes = compiler.compile(source)
-        audio = synth.synth(notes)
-        audio_list.append(audio)
+    if args.output.endswith('.wav'):
+        wname = args.output
     else:
-        if len(audio_list) == 1:
-            audio = audio_list[0]
-        else:
-            audio = synth.merge(audio_list)
-
-        if args.output.endswith('.wav'):
-            wname = args.output
-        else:
-            wname = f"{args.output}.wav"
-
-        synth.wave(wname, audio)
-        
+        wname = f"{args.output}.wav"
+
+    if args.no_cache:
+        cache = None
+    else:
+        cache = CompileCache(Compiler(parser, instructions))
+
+    if args.jobs > 1 and (len(args.source) > 1 or args.pan is not None):
+        jobs = args.jobs
+        scores = args.source ## compiled by the workers
+    else:
+        jobs = 1
+        scores = [compile_source(fname, cache) for fname in args.source]
+
+    synth = Synth(**synth_params)
+    with synth.sink(wname) as sink:
+        if jobs == 1 and len(scores) == 1 and args.pan is None: ## stream blocks straight to the file
+            for block in synth.stream(scores[0]):
+                sink.write(block)
+        else: ## stream the mix of every part to the file
+            with render_all(scores, synth_params, jobs=jobs, pan=args.pan, cache=cache) as tracks:
+                for block in synth.mix(tracks):
+                    sink.write(block)
+
+    if args.verbose and cache is not None:
+        print(f"compile cache: {cache.hits} hits, {cache.misses} misses", file=sys.stderr)
+
 if __name__ == '__main__':
     import sys
     main(len(sys.argv), sys.argv)
\ No newline at end of file
@@ -0,0 +1,104 @@
+import numpy as np
+
+def pan_weights(pan: float, channels: int) -> np.ndarray:
+    """ Per-channel gains for a mono source at `pan` in [-1, 1]
+        (balance pan law, unity at center). Only stereo is panned.
+    """
+    if channels == 2:
+        return np.array([min(1.0, 1.0 - pan), min(1.0, 1.0 + pan)])
+    else:
+        return np.ones(channels)
+
+class Track:
+    """ Re-chunks a stream of float blocks into reads of any size.
+
+        blocks : iterable of float blocks, (frames,) or (frames, channels)
+        gain : linear gain
+        pan : balance in [-1, 1] (left to right), for stereo output
+        offset : frames of silence before the first block
+    """
+
+    def __init__(self, blocks, gain: float = 1.0, pan: float = 0.0, offset: int = 0):
+        self.blocks = iter(blocks)
+        self.gain = gain
+        self.pan = max(min(float(pan), 1.0), -1.0)
+        self.offset = max(0, int(offset))
+
+        self.buffer = None
+        self.done = False
+
+    def read(self, n: int):
+        """ Up to n frames; fewer only once the track is exhausted.
+        """
+        parts = []
+        while n > 0:
+            if self.offset:
+                k = min(n, self.offset)
+                parts.append(np.zeros(k, dtype=float))
+                self.offset -= k
+                n -= k
+                continue
+
+            if self.buffer is None or self.buffer.shape[0] == 0:
+                try:
+                    self.buffer = np.asarray(next(self.blocks), dtype=float)
+                except StopIteration:
+                    self.done = True
+                    break
+                continue
+
+            x, self.buffer = self.buffer[:n], self.buffer[n:]
+            parts.append(x)
+            n -= x.shape[0]
+
+        return parts
+
+    def weights(self, channels: int) -> np.ndarray:
+        """ Per-channel gain.
+        """
+        return self.gain * pan_weights(self.pan, channels)
+
+class Mixer:
+    """ Streaming k-way mixer.
+
+        Pulls `block` frames at a time from every track and accumulates
+        them in float64, so memory is O(block x tracks) regardless of
+        track length. Output is not normalized: callers apply a single
+        final gain or limiter (see `Synth.mix`).
+
+        >>> mixer = Mixer(channels=2)
+        >>> mixer.add(blocks_1, gain=0.5, pan=-0.5)
+        >>> mixer.add(blocks_2, gain=0.5, offset=44_100)
+        >>> for w in mixer: ...
+    """
+
+    def __init__(self, channels: int = 1, block: int = 4096):
+        self.channels = channels
+        self.block = block
+        self.tracks = []
+
+    def add(self, blocks, gain: float = 1.0, pan: float = 0.0, offset: int = 0) -> Track:
+        track = Track(blocks, gain=gain, pan=pan, offset=offset)
+        self.tracks.append(track)
+        return track
+
+    def __iter__(self):
+        while self.tracks:
+            w = np.zeros((self.block, self.channels), dtype=float)
+            m = 0 ## frames produced in this block
+            for track in self.tracks:
+                g = track.weights(self.channels)
+                i = 0
+                for x in track.read(self.block):
+                    j = i + x.shape[0]
+                    if x.ndim == 1:
+                        w[i:j] += np.multiply.outer(x, g)
+                    else:
+                        w[i:j] += x * g
+                    i = j
+                m = max(m, i)
+
+            self.tracks = [track for track in self.tracks if not track.done]
+
+            if m:
+                yield (w[:m, 0] if self.channels == 1 else w[:m])
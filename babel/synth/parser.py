@@ -1,4 +1,6 @@
+import os
 import re
+import sys
 from ply import lex, yacc
 
 tokens = (
@@ -54,8 +56,6 @@ def t_NUMBER(t):
 def t_error(t):
     raise SyntaxError(f'Invalid Token: {t}')
 
-lexer = lex.lex(reflags=re.UNICODE)
-
 def p_start(p):
     ''' start : code
     '''
@@ -84,16 +84,16 @@ def p_expr(p):
 def p_chord(p):
     ''' chord : chordhead
     '''
-    p[0] = ('CHORD', p[1])
+    p[0] = ('CHORD', *p[1])
 
 def p_chordhead(p):
     ''' chordhead : KEY QUALITY
                   | KEY
     '''
     if len(p) == 3:
-        p[0] = p[1] + p[2]
+        p[0] = (p[1], p[2])
     else:
-        p[0] = p[1]
+        p[0] = (p[1], '')
 
 def p_note(p):
     ''' note : notehead DOT
@@ -118,9 +118,9 @@ def p_pitch(p):
               | PAUSE
     '''
     if len(p) == 3:
-        p[0] = f"{p[1]}{p[2]}"
+        p[0] = (p[1], p[2])
     else: ## Pause
-        p[0] = f""
+        p[0] = None
 
 def p_duration(p):
     ''' duration : LBRA NUMBER RBRA
@@ -142,9 +142,13 @@ def p_time(p):
     p[0] = ('TIME', p[2], p[4])
 
 def p_rept(p):
-    ''' rept : LREP code RREP
+    ''' rept : LREP code RREP NUMBER
+             | LREP code RREP
     '''
-    p[0] = ('REPT', p[2])
+    if len(p) == 5:
+        p[0] = ('REPT', p[2], p[4])
+    else:
+        p[0] = ('REPT', p[2])
 
 def p_sign(p):
     ''' sign : SEGNO
@@ -158,11 +162,46 @@ def p_tempo(p):
     p[0] = ('TEMPO', p[2])
 
 def p_error(p):
-    print('lineno=', lexer.lineno)
-    print("lexpos=", lexer.lexpos)
+    print('lineno=', parser.lexer.lineno)
+    print("lexpos=", parser.lexer.lexpos)
     raise SyntaxError(f'Syntax Error:\n{p}')
 
-parser = yacc.yacc()
+class LazyParser:
+    """ Builds the PLY lexer and parser on first use.
+
+        LALR tables are written once to the `tabmodule` cache module, next
+        to this file; PLY regenerates it whenever the grammar signature
+        (or PLY's table version) changes.
+    """
+
+    tabmodule = '_parsetab'
+
+    def __init__(self):
+        self._lexer = None
+        self._parser = None
+
+    @property
+    def lexer(self):
+        if self._lexer is None:
+            self._lexer = lex.lex(module=sys.modules[__name__], reflags=re.UNICODE)
+        return self._lexer
+
+    @property
+    def parser(self):
+        if self._parser is None:
+            self._parser = yacc.yacc(
+                module=sys.modules[__name__],
+                tabmodule=self.tabmodule,
+                outputdir=os.path.dirname(os.path.abspath(__file__)),
+                debug=False
+            )
+        return self._parser
+
+    def parse(self, source: str):
+        self.lexer.lineno = 1
+        return self.parser.parse(source, lexer=self.lexer)
+
+parser = LazyParser()
 
 if __name__ == '__main__':
     print(parser.parse(__doc__))
\ No newline at end of file
@@ -0,0 +1,291 @@
+""" Real-time playback: notes are rendered a few blocks ahead, into a ring
+    buffer, while an audio sink plays them.
+
+    >>> player = Player(Synth(), SimpleAudioSink(44_100), latency=0.2)
+    >>> player.play(iter(Babel()), seconds=30.0)    ## endless
+    >>> player.play(compiler.compile(source, events=True))
+"""
+import threading
+import time
+
+import numpy as np
+
+from .events import Events
+from .sink import WaveSink
+
+class RingBuffer:
+    """ Fixed capacity FIFO of frames, for one writer and one reader thread.
+    """
+
+    def __init__(self, frames: int, channels: int = 1, dtype=float):
+        shape = (frames,) if channels == 1 else (frames, channels)
+        self.data = np.zeros(shape, dtype=dtype)
+        self.capacity = frames
+        self.head = 0 ## frames read
+        self.tail = 0 ## frames written
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return self.tail - self.head
+
+    def write(self, x: np.ndarray, stop: threading.Event = None):
+        """ Blocks until all of x fits (or `stop` is set).
+        """
+        i = 0
+        while i < x.shape[0]:
+            with self.cond:
+                while len(self) == self.capacity:
+                    if stop is not None and stop.is_set():
+                        return
+                    self.cond.wait(0.05)
+                n = min(x.shape[0] - i, self.capacity - len(self))
+                a = self.tail % self.capacity
+                m = min(n, self.capacity - a)
+                self.data[a:a + m] = x[i:i + m]
+                self.data[:n - m] = x[i + m:i + n]
+                self.tail += n
+                self.cond.notify_all()
+            i += n
+
+    def read(self, n: int, timeout: float = None) -> np.ndarray:
+        """ Up to n frames: fewer only if the buffer was closed, or if
+            `timeout` (seconds) expired first.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: len(self) >= n or self.closed, timeout)
+            n = min(n, len(self))
+            a = self.head % self.capacity
+            x = np.take(self.data, np.arange(a, a + n) % self.capacity, axis=0)
+            self.head += n
+            self.cond.notify_all()
+            return x
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+class Sink:
+    """ Audio output, consuming frames at `sample_rate`.
+
+        `write` blocks while more than `buffer` frames are waiting to be
+        played, as a sound card does. The device clock is simulated with
+        `time.perf_counter` (real time) or not at all (`realtime=False`:
+        frames are consumed as soon as written). Subclasses output the
+        bytes in `_write`.
+    """
+
+    def __init__(self, sample_rate: int, channels: int = 1, bits: int = 16, **kwargs):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bits = bits
+        self.frame_size = channels * (bits // 8)
+
+        self.realtime = kwargs.get('realtime', True)
+        self.buffer = int(kwargs.get('buffer', 2048)) ## device buffer, in frames
+
+        self.written = 0 ## frames
+        self.starved = 0 ## times the device ran out of frames
+        self.t0 = None
+        self.base = 0
+
+    def played(self) -> int:
+        """ Frames played by the device so far.
+        """
+        if not self.realtime or self.t0 is None:
+            return self.written
+        return min(self.written, self.base + int((time.perf_counter() - self.t0) * self.sample_rate))
+
+    def write(self, pcm: bytearray):
+        n = len(pcm) // self.frame_size
+
+        if self.realtime:
+            if self.t0 is None or self.played() >= self.written: ## (re)start the clock
+                if self.t0 is not None:
+                    self.starved += 1
+                self.t0 = time.perf_counter()
+                self.base = self.written
+            while self.written - self.played() > self.buffer:
+                time.sleep(max((self.written - self.played() - self.buffer) / self.sample_rate, 1e-4))
+
+        self._write(pcm)
+        self.written += n
+
+    def _write(self, pcm: bytearray):
+        pass
+
+    def drain(self):
+        """ Waits until every frame was played.
+        """
+        while self.realtime and self.played() < self.written:
+            time.sleep((self.written - self.played()) / self.sample_rate)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class NullSink(Sink):
+    """ Discards audio, at real-time pace (e.g. for tests and benchmarks).
+    """
+
+class FileSink(Sink):
+    """ Streams audio to a .wav file (at real-time pace, unless realtime=False).
+    """
+
+    def __init__(self, fname: str, sample_rate: int, channels: int = 1, bits: int = 16, **kwargs):
+        Sink.__init__(self, sample_rate, channels, bits, **kwargs)
+        self.file = WaveSink(fname, sample_rate, channels, bits)
+
+    def _write(self, pcm: bytearray):
+        self.file.write(pcm)
+
+    def close(self):
+        self.file.close()
+
+class SimpleAudioSink(Sink):
+    """ Plays through `simpleaudio`.
+
+        simpleaudio has no streaming API: each write is played as its own
+        buffer, started when the previous one ends, so the device buffer
+        is one write and there may be small gaps between them; larger
+        periods hide them better.
+    """
+
+    def __init__(self, sample_rate: int, channels: int = 1, bits: int = 16, **kwargs):
+        # Audio backend is only loaded when needed
+        import simpleaudio as sa
+
+        Sink.__init__(self, sample_rate, channels, bits, **kwargs)
+        self.sa = sa
+        self.buffer = 0
+        self.play = None
+
+    def _write(self, pcm: bytearray):
+        if self.play is not None:
+            self.play.wait_done()
+        self.play = self.sa.play_buffer(pcm, self.channels, self.bits // 8, self.sample_rate)
+
+    def close(self):
+        if self.play is not None:
+            self.play.wait_done()
+
+class Player:
+    """ Renders notes into a ring buffer, from a background thread, while
+        the calling thread feeds the sink one period at a time.
+
+        latency : seconds of audio rendered ahead (ring buffer size)
+        period : frames per sink write
+        peak : normalization; songs are not known in advance, so samples
+               are divided by this fixed peak, then clipped.
+
+        Whenever the ring buffer cannot fill a period in time, the missing
+        frames are played as silence and counted as an underrun.
+    """
+
+    latency = 0.1
+
+    period = 1024
+
+    peak = 1.0
+
+    def __init__(self, synth, sink: Sink, **kwargs):
+        if 'latency' in kwargs:
+            self.latency = max(float(kwargs['latency']), 0.0)
+
+        if 'period' in kwargs:
+            self.period = max(1, int(kwargs['period']))
+
+        if 'peak' in kwargs:
+            self.peak = float(kwargs['peak'])
+
+        self.synth = synth
+        self.sink = sink
+
+        self.capacity = max(self.period, int(self.latency * synth.sample_rate))
+
+        self.underruns = 0
+        self.frames = 0
+
+    def _blocks(self, notes):
+        if isinstance(notes, Events):
+            return self.synth._blocks(notes, self.period)
+        else:
+            return self.synth._live(notes, self.period)
+
+    def _produce(self, notes, ring: RingBuffer, stop: threading.Event, errors: list):
+        try:
+            for w in self._blocks(notes):
+                if stop.is_set():
+                    break
+                ring.write(self.synth._quantize(w / self.peak), stop)
+        except Exception as error: ## reported by the consumer
+            errors.append(error)
+        finally:
+            ring.close()
+
+    def play(self, notes, seconds: float = None) -> dict:
+        """ Plays notes (Events, or an iterable of notes, possibly endless)
+            until they end, `seconds` have been played or Ctrl+C.
+            -> playback stats
+        """
+        synth = self.synth
+        ring = RingBuffer(self.capacity, synth.channels, synth.type)
+        stop = threading.Event()
+        errors = []
+
+        limit = None if seconds is None else int(seconds * synth.sample_rate)
+        underruns = 0
+        frames = 0
+
+        producer = threading.Thread(target=self._produce, args=(notes, ring, stop, errors), daemon=True)
+        producer.start()
+
+        ## let the renderer get ahead before the clock starts
+        with ring.cond:
+            ring.cond.wait_for(lambda: len(ring) >= self.capacity or ring.closed)
+
+        start = time.perf_counter()
+        try:
+            while limit is None or frames < limit:
+                n = self.period if limit is None else min(self.period, limit - frames)
+                if self.sink.realtime: ## until the device runs dry
+                    x = ring.read(n, timeout=(self.sink.written - self.sink.played()) / synth.sample_rate)
+                else:
+                    x = ring.read(n)
+                if x.shape[0] < n:
+                    if ring.closed and len(ring) == 0:
+                        if x.shape[0] == 0:
+                            break
+                    else: ## renderer fell behind: fill with silence
+                        underruns += 1
+                        pad = np.zeros((n - x.shape[0],) + x.shape[1:], dtype=x.dtype)
+                        x = np.concatenate([x, pad])
+                self.sink.write(synth._encode(x))
+                frames += x.shape[0]
+            self.sink.drain()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            producer.join()
+
+        if errors:
+            raise errors[0]
+
+        self.underruns += underruns
+        self.frames += frames
+
+        return {
+            'frames' : frames,
+            'seconds' : frames / synth.sample_rate,
+            'elapsed' : time.perf_counter() - start,
+            'underruns' : underruns,
+            'starved' : self.sink.starved,
+            'latency' : (self.capacity + self.sink.buffer) / synth.sample_rate,
+        }
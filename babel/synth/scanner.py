@@ -0,0 +1,208 @@
+""" Hand-written, single-pass alternative to the PLY parser.
+
+    Emits the same intermediate tuples as `parser.parser`, in linear time:
+    tokens come from one master regex and repeats are closed with an
+    explicit stack instead of rebuilding tuples on every expression.
+
+    >>> Compiler(parser=scanner, instructions=instructions)
+"""
+import re
+from bisect import bisect_left
+
+## Same token rules (and priority) as the PLY lexer
+TOKEN_RE = re.compile(r'''
+      (?P<IGNORE>[ \t]+|\/\*[\s\S]*?\*\/)
+    | (?P<NEWLINE>\n+)
+    | (?P<NUMBER>[1-9][0-9]*)
+    | (?P<KEY>[A-G][\#b\§]?)
+    | (?P<LREP>\|\:)
+    | (?P<RREP>\:\|)
+    | (?P<QUALITY>[mº])
+    | (?P<DOT>\.)
+    | (?P<BAR>\/)
+    | (?P<SEGNO>\%)
+    | (?P<CODA>\@)
+    | (?P<TEMPO>\!)
+    | (?P<LBRA>\[)
+    | (?P<RBRA>\])
+    | (?P<LPAR>\()
+    | (?P<RPAR>\))
+    | (?P<PAUSE>\-)
+    | (?P<CLEF>\$)
+    | (?P<ERROR>.)
+''', flags=re.UNICODE | re.VERBOSE)
+
+class Scanner:
+
+    def tokenize(self, source: str) -> list:
+        """ source -> [(type, value, position), ...]
+        """
+        return list(self._scan(source))
+
+    def _scan(self, source: str, pos: int = 0):
+        for m in TOKEN_RE.finditer(source, pos):
+            kind = m.lastgroup
+            if kind == 'IGNORE' or kind == 'NEWLINE':
+                continue
+            elif kind == 'NUMBER':
+                yield (kind, int(m.group()), m.start())
+            else: ## invalid characters raise only when parsed, as in PLY (whose lexer is lazy)
+                yield (kind, m.group(), m.start())
+
+    def relex(self, old: str, tokens: list, source: str) -> list:
+        """ Tokenizes `source`, an edit of `old` (which gave `tokens`).
+
+            Only the edited region is scanned again: lexing restarts at the
+            last token before the edit and stops as soon as a new token lands
+            on an old token boundary past the edit, since the text after it
+            is unchanged. Remaining tokens are reused, shifted.
+        """
+        a = common_prefix(old, source)
+        if a == len(old) == len(source):
+            return tokens
+
+        c = common_prefix(old[a:][::-1], source[a:][::-1]) ## common suffix
+        end = len(source) - c ## edit region in source: [a, end)
+        shift = len(source) - len(old)
+
+        starts = [t[2] for t in tokens]
+        r = bisect_left(starts, a) - 1 ## last token starting before the edit
+
+        if r < 0:
+            pos, new = 0, []
+        else:
+            pos, new = starts[r], tokens[:r]
+
+        for token in self._scan(source, pos):
+            q = token[2]
+            if q >= end:
+                t = bisect_left(starts, q - shift)
+                if t < len(starts) and starts[t] == q - shift: ## resync
+                    new.extend((k, v, s + shift) for k, v, s in tokens[t:])
+                    return new
+            new.append(token)
+        return new
+
+    @staticmethod
+    def lineno(source: str, pos: int) -> int:
+        return source.count('\n', 0, pos) + 1
+
+    def parse(self, source: str, tokens: list = None) -> list:
+        """ tokens : from `tokenize` or `relex`, to skip lexing
+        """
+        if tokens is None:
+            tokens = self.tokenize(source)
+        n = len(tokens)
+
+        def kind(i: int):
+            return tokens[i][0] if i < n else None
+
+        def expect(i: int, *kinds):
+            if kind(i) not in kinds:
+                error(i)
+            return tokens[i][1]
+
+        def error(i: int): ## same messages as the PLY parser
+            if i < n:
+                k, v, pos = tokens[i]
+                if k == 'ERROR':
+                    raise SyntaxError(f'Invalid Token: LexToken(error,{source[pos:]!r},{self.lineno(source, pos)},{pos})')
+                raise SyntaxError(f'Syntax Error:\nLexToken({k},{v!r},{self.lineno(source, pos)},{pos})')
+            else:
+                raise SyntaxError('Syntax Error:\nNone')
+
+        stack = [[]] ## one code list per open repeat
+        i = 0
+        while i < n:
+            k, v, _ = tokens[i]
+            code = stack[-1]
+
+            if k == 'KEY' or k == 'PAUSE':
+                if k == 'PAUSE':
+                    pitch = None
+                    i += 1
+                elif kind(i + 1) == 'NUMBER':
+                    pitch = (v, tokens[i + 1][1])
+                    i += 2
+                elif kind(i + 1) == 'QUALITY':
+                    code.append(('CHORD', v, tokens[i + 1][1]))
+                    i += 2
+                    continue
+                else:
+                    code.append(('CHORD', v, ''))
+                    i += 1
+                    continue
+
+                if kind(i) == 'LBRA':
+                    duration = expect(i + 1, 'NUMBER')
+                    expect(i + 2, 'RBRA')
+                    i += 3
+                else:
+                    duration = None
+
+                if kind(i) == 'DOT':
+                    i += 1
+                    code.append(('NOTE', pitch, duration, True))
+                else:
+                    code.append(('NOTE', pitch, duration, False))
+
+            elif k == 'CLEF':
+                key = expect(i + 1, 'KEY')
+                if kind(i + 2) == 'QUALITY':
+                    code.append(('TONE', key + tokens[i + 2][1]))
+                    i += 3
+                else:
+                    code.append(('TONE', key))
+                    i += 2
+
+            elif k == 'LPAR':
+                a = expect(i + 1, 'NUMBER')
+                expect(i + 2, 'BAR')
+                b = expect(i + 3, 'NUMBER')
+                expect(i + 4, 'RPAR')
+                code.append(('TIME', a, b))
+                i += 5
+
+            elif k == 'TEMPO':
+                code.append(('TEMPO', expect(i + 1, 'NUMBER')))
+                i += 2
+
+            elif k == 'SEGNO' or k == 'CODA':
+                code.append(('SIGN', v))
+                i += 1
+
+            elif k == 'LREP':
+                stack.append([])
+                i += 1
+
+            elif k == 'RREP':
+                if len(stack) == 1 or not code:
+                    error(i)
+                stack.pop()
+                if kind(i + 1) == 'NUMBER':
+                    stack[-1].append(('REPT', tuple(code), tokens[i + 1][1]))
+                    i += 2
+                else:
+                    stack[-1].append(('REPT', tuple(code)))
+                    i += 1
+
+            else:
+                error(i)
+
+        if len(stack) != 1 or not stack[0]:
+            error(n)
+
+        return stack[0]
+
+def common_prefix(x: str, y: str, chunk: int = 4096) -> int:
+    """ Length of the common prefix of x and y, compared chunk by chunk.
+    """
+    n = min(len(x), len(y))
+    i = 0
+    while i + chunk <= n and x[i:i + chunk] == y[i:i + chunk]:
+        i += chunk
+    while i < n and x[i] == y[i]:
+        i += 1
+    return i
+
+scanner = Scanner()
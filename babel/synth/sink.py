@@ -0,0 +1,93 @@
+import struct
+
+class WaveSink:
+    """ Streaming .wav writer.
+
+        Opens the file and writes the header first, appends PCM blocks as
+        they are produced and patches the RIFF/data sizes on close. Files
+        whose data grows past 4 GiB are written as RF64 (EBU Tech 3306):
+        a 'JUNK' chunk is reserved up front and becomes the 'ds64' chunk.
+
+        >>> with WaveSink('music.wav', 44_100, 1, 16) as sink:
+        ...     for block in synth.stream(notes):
+        ...         sink.write(block)
+    """
+
+    MAX_SIZE = 0xFFFFFFFF
+
+    def __init__(self, fname: str, sample_rate: int, channels: int = 1, bits: int = 16):
+        self.fname = fname
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bits = bits
+
+        self.frame_size = channels * (bits // 8)
+
+        self.nbytes = 0 ## data chunk size
+
+        self.file = open(fname, 'wb')
+        self._header()
+
+    def _header(self):
+        self.file.write(b'RIFF')
+        self.file.write(struct.pack('<I', 0))
+        self.file.write(b'WAVE')
+
+        ## room for a 'ds64' chunk
+        self.file.write(b'JUNK')
+        self.file.write(struct.pack('<I', 28))
+        self.file.write(bytes(28))
+
+        self.file.write(b'fmt ')
+        self.file.write(struct.pack('<IHHIIHH',
+            16,
+            1, ## PCM
+            self.channels,
+            self.sample_rate,
+            self.sample_rate * self.frame_size, ## byte rate
+            self.frame_size, ## block align
+            self.bits
+        ))
+
+        self.file.write(b'data')
+        self._data = self.file.tell()
+        self.file.write(struct.pack('<I', 0))
+
+    @property
+    def nframes(self) -> int:
+        return self.nbytes // self.frame_size
+
+    def write(self, block: bytes):
+        self.file.write(block)
+        self.nbytes += len(block)
+
+    def close(self):
+        if self.file.closed: return
+
+        if self.nbytes % 2: ## chunks are word aligned
+            self.file.write(b'\x00')
+
+        riff_size = self.file.tell() - 8
+
+        if riff_size > self.MAX_SIZE:
+            self.file.seek(0)
+            self.file.write(b'RF64')
+            self.file.write(struct.pack('<I', self.MAX_SIZE))
+            self.file.seek(12)
+            self.file.write(b'ds64')
+            self.file.write(struct.pack('<IQQQI', 28, riff_size, self.nbytes, self.nframes, 0))
+            self.file.seek(self._data)
+            self.file.write(struct.pack('<I', self.MAX_SIZE))
+        else:
+            self.file.seek(4)
+            self.file.write(struct.pack('<I', riff_size))
+            self.file.seek(self._data)
+            self.file.write(struct.pack('<I', self.nbytes))
+
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
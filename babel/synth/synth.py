@@ -1,21 +1,11 @@
+import sys
+
 import numpy as np
-import wave
-import simpleaudio as sa
 
 from .instruments import Instrument
-
-def gcd(a: int, b: int) -> int:
-    while b: 
-       a, b = b, a % b
-    return a 
-
-def lazy_mean(X: list, dtype: type):
-    n = len(X)
-    y = np.zeros(max(map(len, X)), dtype=dtype)
-    for x in X:
-        y[:len(x)] += (x / n).astype(dtype)
-    else:
-        return y
+from .events import Events
+from .mixer import Mixer, pan_weights
+from .sink import WaveSink
 
 PI = np.pi
 TWO_PI = 2.0 * PI
@@ -28,6 +18,8 @@ class Synth:
 
     channels = 1
 
+    pan = 0.0
+
     shape = None
 
     gain = 1.0
@@ -36,6 +28,8 @@ class Synth:
 
     type = np.int16
 
+    block = 4096
+
     def __init__(self, **kwargs):
         if 'sample_rate' in kwargs:
             self.sample_rate = max(min(int(kwargs['sample_rate']), 88200), 22050)
@@ -43,8 +37,20 @@ class Synth:
         if 'gain' in kwargs:
             self.gain = max(min(float(kwargs['gain']), 1.0), 0.0)
 
-        if 'instrument' in kwargs:
-            self.instrument = Instrument.get(kwargs['instrument'])
+        if 'instrument' in kwargs or 'cache' in kwargs:
+            self.instrument = Instrument.get(
+                kwargs.get('instrument', self.instrument.__key__),
+                **({'cache': kwargs['cache']} if 'cache' in kwargs else {})
+            )
+
+        ## indexed by the events' instrument column
+        if 'instruments' in kwargs:
+            self.instruments = [
+                Instrument.get(key, **({'cache': kwargs['cache']} if 'cache' in kwargs else {}))
+                for key in kwargs['instruments']
+            ]
+        else:
+            self.instruments = [self.instrument]
 
         if 'shape' in kwargs:
             self.shape = kwargs['shape']
@@ -53,6 +59,12 @@ class Synth:
         if 'channels' in kwargs:
             self.channels = max(1, int(kwargs['channels']))
 
+        if 'pan' in kwargs:
+            self.pan = max(min(float(kwargs['pan']), 1.0), -1.0)
+
+        if 'block' in kwargs:
+            self.block = max(1, int(kwargs['block']))
+
         if 'bits' in kwargs:
             self.bits = int(kwargs['bits'])
             if self.bits not in {8, 16, 24, 32}:
@@ -67,28 +79,192 @@ class Synth:
 
         self.amp = (1 << (self.bits - 1)) - 1
 
-    def _synth(self, notes: list):
+    def _frames(self, notes: list, chunk: int = 4096):
+        """ notes -> (frequency, duration, instrument, velocity, pan, i, j),
+            with sample offsets
+
+            notes : Events, [(frequency, duration), ...] or [(frequency, duration, pan), ...]
         """
+        events = self._events(notes)
+
+        for a in range(0, len(events), chunk): ## bounded, even for memory-mapped scores
+            e = events.data[a:a + chunk]
+            j = e['offset'] + (e['duration'] * self.sample_rate).astype(np.int64)
+            pan = np.where(np.isnan(e['pan']), self.pan, e['pan'])
+            yield from zip(
+                e['frequency'].tolist(),
+                e['duration'].tolist(),
+                e['instrument'].tolist(),
+                e['velocity'].tolist(),
+                pan.tolist(),
+                e['offset'].tolist(),
+                j.tolist()
+            )
+
+    def _events(self, notes: list) -> Events:
+        if isinstance(notes, Events):
+            return notes.at(self.sample_rate)
+        else:
+            return Events.from_notes(notes, self.sample_rate)
+
+    def _zeros(self, n: int) -> np.ndarray:
+        """ Silent (frames,) or (frames x channels) wave vector
         """
-        total_duration = sum(duration for frequency, duration in notes)
+        if self.channels == 1:
+            return np.zeros(n, dtype=float)
+        else:
+            return np.zeros((n, self.channels), dtype=float)
+
+    def _blocks(self, notes: list, block: int = None):
+        """ Renders notes as consecutive float blocks of (at most) `block` frames.
 
-        n = int(total_duration * self.sample_rate)
+            Each note is rendered on its own and kept in `pending` until the
+            end of its envelope release has been mixed, so memory depends on
+            the longest note, not on the song length. With more than one
+            channel, blocks are (frames x channels) and notes are panned.
+        """
+        notes = self._events(notes)
+        n = int(notes.total_duration * self.sample_rate)
+        return self._render(self._frames(notes), n, block)
 
-        t = np.linspace(0.0, total_duration, num=n, endpoint=False, dtype=float)
-        w = np.zeros(n, dtype=float) ## wave vector
+    def _live(self, notes, block: int = None):
+        """ As `_blocks`, for an iterable of notes of unknown (or endless)
+            length, e.g. `iter(Babel())`: notes are pulled only as blocks
+            are needed, and the last releases ring out in full.
 
-        i, j = 0, 0
-        for frequency, duration in notes:
-            i, j = j, (j + int(duration * self.sample_rate))
-            if frequency is None: continue
-            self.instrument.touch(frequency, duration, t, w, i, j, n)
+            notes : [(frequency, duration), ...] or [(frequency, duration, pan), ...]
+        """
+        def frames():
+            i = 0
+            for note in notes:
+                frequency, duration = note[0], note[1]
+                j = i + int(duration * self.sample_rate)
+                yield (
+                    np.nan if frequency is None else frequency,
+                    duration,
+                    0,
+                    1.0,
+                    note[2] if len(note) > 2 else self.pan,
+                    i,
+                    j
+                )
+                i = j
+        return self._render(frames(), None, block)
+
+    def _render(self, frames, n: int = None, block: int = None):
+        """ (frequency, duration, instrument, velocity, pan, i, j) -> float blocks
+
+            n : song length, in frames (None: until the last release ends)
+        """
+        if block is None:
+            block = self.block
+
+        pending = [] ## [(start, wave, channel gains), ...]
+        k = 0 ## current block start
+        end = 0 ## last sounding frame, so far
+
+        def flush(k: int, size: int) -> np.ndarray:
+            w = self._zeros(size)
+            l = k + w.shape[0]
+            for note in pending:
+                self._add(w, k, *note)
+            pending[:] = [(s, x, g) for s, x, g in pending if s + x.shape[0] > l]
+            return w
+
+        for frequency, duration, instrument, velocity, pan, i, j in frames:
+            while i >= k + block:
+                yield flush(k, block if n is None else min(block, n - k))
+                k += block
+            end = max(end, j)
+            if frequency != frequency: continue ## NaN: pause
+            note = self._note(frequency, duration, instrument, velocity, pan, i, j, sys.maxsize if n is None else n)
+            end = max(end, note[0] + note[1].shape[0])
+            pending.append(note)
+
+        if n is None:
+            n = end
+
+        while k < n:
+            yield flush(k, min(block, n - k))
+            k += block
+
+    def _note(self, frequency: float, duration: float, instrument: int, velocity: float, pan: float, i: int, j: int, n: int):
+        """ Renders one event -> (start, wave, channel gains)
+        """
+        instrument = self.instruments[instrument]
+        i, j = instrument.subframe(duration, i, j, n)
+        x = instrument.render(frequency, duration, j - i, self.sample_rate)
+        if velocity != 1.0:
+            x = x * velocity
+        g = None if self.channels == 1 else pan_weights(pan, self.channels)
+        return (i, x, g)
+
+    @staticmethod
+    def _add(w: np.ndarray, k: int, s: int, x: np.ndarray, g: np.ndarray):
+        """ Mixes note x (starting at frame s) into w (starting at frame k)
+        """
+        a, b = max(s, k), min(s + x.shape[0], k + w.shape[0])
+        if a >= b:
+            return
+        elif g is None:
+            w[a - k:b - k] += x[a - s:b - s]
         else:
-            w /= np.max(np.abs(w))
-            return (w * self.amp * self.gain).astype(self.type)
+            w[a - k:b - k] += np.multiply.outer(x[a - s:b - s], g)
+
+    def _peak(self, notes: list, block: int = None) -> float:
+        """ Pre-pass: peak amplitude of the rendered song, in constant memory.
+        """
+        return max((np.max(np.abs(w)) for w in self._blocks(notes, block) if w.shape[0]), default=0.0)
+
+    def _normalize(self, w: np.ndarray, peak: float) -> np.ndarray:
+        if peak > 0.0:
+            w = w / peak
+        return self._quantize(w)
+
+    def _quantize(self, w: np.ndarray) -> np.ndarray:
+        """ [-1, 1] float samples -> PCM samples (clipping limiter)
+        """
+        return (np.clip(w, -1.0, 1.0) * self.amp * self.gain).astype(self.type)
+
+    def _synth(self, notes: list):
+        """
+        """
+        w = np.concatenate([self._zeros(0), *self._blocks(notes)]) ## wave vector
+        return self._normalize(w, np.max(np.abs(w), initial=0.0))
 
     def synth(self, notes: list) -> bytearray:
         return self._encode(self._synth(notes))
 
+    def stream(self, notes: list, block: int = None, peak: float = None):
+        """ Yields encoded PCM blocks of `block` frames.
+
+            peak : normalization peak; when omitted, it is measured by a
+                   rendering pre-pass (exact for deterministic instruments,
+                   random effects are clipped by the limiter).
+        """
+        for w in self._stream(notes, block, peak):
+            yield self._encode(self._quantize(w))
+
+    def _stream(self, notes: list, block: int = None, peak: float = None):
+        """ Normalized float blocks, in [-1, 1].
+        """
+        if peak is None:
+            peak = self._peak(notes, block)
+
+        for w in self._blocks(notes, block):
+            yield (w / peak) if peak > 0.0 else w
+
+    def mix(self, tracks: list, block: int = None):
+        """ Averages normalized float tracks (e.g. from `_stream`) and yields
+            encoded PCM blocks. Memory is O(block x tracks).
+        """
+        mixer = Mixer(channels=self.channels, block=self.block if block is None else block)
+        for track in tracks:
+            mixer.add(track, gain=1.0 / len(tracks))
+
+        for w in mixer:
+            yield self._encode(self._quantize(w))
+
     def _shape(self, w: np.ndarray, i: int, j: int):
         if self.shape is None:
             return None
@@ -96,48 +272,47 @@ class Synth:
             w[i:j] *= self.shape(i, j) # pylint: disable=not-callable
 
     def _decode(self, w: bytearray) -> np.ndarray:
-        a = self.bits
-        b = 8 * self.type(0).nbytes
-
-        if a == b:
-            buffer = w
+        """ PCM bytes (little endian) -> samples of `self.type`
+        """
+        if self.bits == 8: ## unsigned, offset binary
+            return np.subtract(np.frombuffer(w, dtype=np.uint8), 128, dtype=self.type)
+        elif self.bits == 24:
+            ## place each 3-byte sample in the upper bytes of an int32,
+            ## then shift back down to sign-extend
+            x = np.zeros((len(w) // 3, 4), dtype=np.uint8)
+            x[:, 1:] = np.frombuffer(w, dtype=np.uint8).reshape(-1, 3)
+            return np.right_shift(x.view('<i4').reshape(-1), 8).astype(self.type, copy=False)
         else:
-            c = gcd(a, b)
-            a //= c
-            b //= c
-            buffer = [(x + b'\x00') if ((i - b) % a) else x for i, x in enumerate(w)]
-        
-        return np.frombuffer(buffer, dtype=self.type)
+            return np.frombuffer(w, dtype=f'<i{self.bits // 8}').astype(self.type, copy=False)
 
     def _encode(self, w: np.ndarray) -> bytearray:
-        a = self.bits
-        b = 8 * self.type(0).nbytes
-
-        if a == b:
-            return bytearray(w.tobytes())
+        """ samples -> PCM bytes (little endian)
+        """
+        if self.bits == 8: ## unsigned, offset binary
+            x = np.add(w, 128, dtype=np.int16).astype(np.uint8)
+        elif self.bits == 24:
+            ## drop the (sign extension) high byte of each int32
+            x = np.ascontiguousarray(w, dtype='<i4').view(np.uint8).reshape(-1, 4)[:, :3]
         else:
-            c = gcd(a, b)
-            a //= c
-            b //= c
-            return bytearray([x for i, x in enumerate(w.tobytes()) if ((i - a) % b)])
+            x = np.ascontiguousarray(w, dtype=f'<i{self.bits // 8}')
+
+        return bytearray(np.ascontiguousarray(x).data)
+
+    def sink(self, fname: str) -> WaveSink:
+        """ Opens a streaming .wav writer with this synth's format.
+        """
+        return WaveSink(fname, self.sample_rate, self.channels, self.bits)
 
     def wave(self, fname: str, audio: bytearray) -> None:
         """ Writes sound to .wav file
         """
-        if self.channels == 1:
-            nframes = len(audio)
-        else:
-            nframes = len(audio[0])
-
-        with wave.open(fname, 'wb') as wave_write:
-            ## pylint: disable=no-member
-            wave_write.setframerate(self.sample_rate)
-            wave_write.setnchannels(self.channels)
-            wave_write.setsampwidth(self.bits // 8)
-            wave_write.setnframes(nframes)
-            wave_write.writeframes(audio)
+        with self.sink(fname) as sink:
+            sink.write(audio)
 
     def play(self, w: np.ndarray, sync: bool=True):
+        # Audio backend is only loaded when needed
+        import simpleaudio as sa
+
         # Play sound
         play = sa.play_buffer(w, self.channels, self.bits // 8, self.sample_rate)
 
@@ -150,9 +325,17 @@ class Synth:
     def merge(self, *channels: list) -> list:
         """ cls.merge([audio_1: bytearray, ...], [audio_k: bytearray, ...], ...)
         """
-        audio = [self._encode(lazy_mean([self._decode(w) for w in channel], self.type)) for channel in channels]
-        
+        audio = []
+        for channel in channels:
+            mixer = Mixer(channels=self.channels, block=self.block)
+            for w in channel:
+                w = self._decode(w)
+                if self.channels != 1:
+                    w = w.reshape(-1, self.channels)
+                mixer.add([w], gain=1.0 / len(channel))
+            audio.append(bytearray().join(self._encode(w.astype(self.type)) for w in mixer))
+
         if len(audio) == 1:
             return audio[0]
         else:
-            return audio
\ No newline at end of file
+            return audio
@@ -0,0 +1,308 @@
+""" Benchmarks
+
+    $ python benchmark.py memory
+    $ python benchmark.py compose
+    $ python benchmark.py train
+    $ python benchmark.py live
+    $ python benchmark.py store
+    $ python benchmark.py pcm
+    $ python benchmark.py import
+    $ python benchmark.py parse
+    $ python benchmark.py notes
+"""
+import sys
+import time
+import numpy as np
+
+from babel import Babel, Markos, SparseMarkos
+
+def walk(n: int, length: int, step: int = 12, seed: int = 0) -> np.ndarray:
+    """ Random walk over n states, with jumps of at most `step`:
+        like melodies, each state reaches only a few others.
+    """
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.integers(-step, step + 1, length)) % n
+
+def score(notes: int, repeat: bool = True, seed: int = 0) -> str:
+    """ Generated source with `notes` notes (and a chord every bar of 4),
+        in C major and 4/4, wrapped in one repeat.
+    """
+    rng = np.random.default_rng(seed)
+    keys = np.array(list("CDEFGAB"))
+    chords = ["C", "Dm", "Em", "F", "G", "Am", "Bº"]
+    lines = ["$C", "!120", "(4/4)"]
+    for i in range(0, notes, 16):
+        bar = [chords[rng.integers(7)]]
+        for k, o in zip(keys[rng.integers(0, 7, min(16, notes - i))], rng.integers(4, 6, 16)):
+            bar.append(f"{k}{o}[16]")
+        lines.append(" ".join(bar))
+    body = "\n".join(lines[3:])
+    return "\n".join(lines[:3]) + ("\n|:\n" + body + "\n:|\n" if repeat else "\n" + body + "\n")
+
+def memory(sizes=(96, 384, 1536), length=100_000):
+    """ Dense vs. sparse transition storage, after training on the same walk.
+    """
+    print(f"{'n':>6} {'nonzero':>9} {'dense':>12} {'sparse':>12} {'ratio':>7} {'dense/draw':>11} {'sparse/draw':>12}")
+    for n in sizes:
+        data = walk(n, length)
+        row = []
+        for model in (Markos, SparseMarkos):
+            m = model(n)
+            m.train(data)
+            m.seed(int(data[0]))
+            next(m)
+            t = time.perf_counter()
+            for _ in range(2_000):
+                next(m)
+            row.append((m.nbytes, (time.perf_counter() - t) / 2_000))
+        (dense, td), (sparse, ts) = row
+        nonzero = len(np.unique(data[:-1] * n + data[1:]))
+        print(f"{n:>6} {nonzero:>9} {dense:>12,} {sparse:>12,} {dense / sparse:>6.0f}x {1e6 * td:>9.1f}us {1e6 * ts:>10.1f}us")
+
+def babel(fname: str = "archive/tetris.mus") -> Babel:
+    """ Babel trained as in main.py
+    """
+    from babel import Compiler, parser, instructions, cmd_rel_note, cmd_chord
+
+    with open(fname, 'r') as file:
+        source = file.read()
+
+    instructions = {**instructions, 'NOTE': cmd_rel_note, 'CHORD': cmd_chord}
+    data = Compiler(parser, instructions).compile(source)
+
+    bb = Babel(instrument='synth')
+    bb.cm.seed(5)
+    bb.nm.basic_train()
+    bb.tm.basic_train()
+    bb.train(data, weight=100)
+    return bb
+
+def compose(bars: int = 2_000, repeat: int = 3):
+    """ Babel.compose throughput, in notes per second.
+    """
+    bb = babel()
+    best = 0.0
+    for _ in range(repeat):
+        t = time.perf_counter()
+        notes = bb.compose(bars)
+        best = max(best, len(notes) / (time.perf_counter() - t))
+    print(f"compose: {best:,.0f} notes/s ({bars} bars)")
+
+    best = 0.0
+    for _ in range(repeat):
+        t = time.perf_counter()
+        _, _, lengths = bb.compose_batch(bars // 20, 1_000)
+        best = max(best, lengths.sum() / (time.perf_counter() - t))
+    print(f"compose_batch: {best:,.0f} notes/s (1000 chains x {bars // 20} bars)")
+
+def train(copies: int = 1_000):
+    """ Training on a corpus: every archive score, `copies` times.
+    """
+    from glob import glob
+    from babel.babel import codes
+    from babel.markos import concat
+
+    scores = [x for x in map(codes, sorted(glob("archive/*.mus"))) if x is not None] * copies
+    lists = [[(n, None if t < 0 else t) for n, t in x.tolist()] for x in scores]
+
+    t = time.perf_counter()
+    bb = Babel()
+    for data in lists:
+        bb.train(data)
+    a = time.perf_counter() - t
+
+    t = time.perf_counter()
+    data, starts = concat([x.ravel() for x in scores])
+    bb = Babel()
+    bb.fit(data.reshape(-1, 2), starts=starts // 2)
+    b = time.perf_counter() - t
+
+    print(f"train: {len(scores):,} scores, {len(data) // 2:,} rows: one by one {a:.3f}s, batched {b:.3f}s")
+
+def live(seconds: float = 5.0):
+    """ Real-time playback of Babel to a null sink: underruns per latency.
+    """
+    from babel.synth import NullSink
+
+    bb = babel()
+    for latency in (0.01, 0.05, 0.2):
+        stats = bb.live(seconds, NullSink(bb.synth.sample_rate), latency=latency, period=256)
+        print(f"live: latency {1e3 * stats['latency']:>5.1f} ms, {stats['underruns']} underruns, {stats['starved']} starved in {stats['seconds']:.1f}s")
+
+def store(fname: str = "/tmp/babel.npz", order: int = 3, copies: int = 20, repeat: int = 5):
+    """ Startup: training on the archive (every score, `copies` times) vs.
+        loading the saved model.
+    """
+    import os
+    from glob import glob
+
+    t = time.perf_counter()
+    bb = Babel(order=order)
+    bb.cm.seed(5)
+    bb.nm.basic_train()
+    bb.tm.basic_train()
+    bb.train_files(sorted(glob("archive/*.mus")) * copies)
+    bb.compose(1)
+    a = time.perf_counter() - t
+
+    bb.save(fname)
+    times = {}
+    for mmap in (True, False):
+        best = float('inf')
+        for _ in range(repeat):
+            t = time.perf_counter()
+            Babel.load(fname, mmap=mmap).compose(1)
+            best = min(best, time.perf_counter() - t)
+        times[mmap] = best
+
+    print(f"store: {os.path.getsize(fname):,} bytes on disk ({bb.nm.nbytes:,} in memory); "
+          f"train {1e3 * a:.1f} ms, load {1e3 * times[False]:.1f} ms, mmap {1e3 * times[True]:.1f} ms")
+
+def pcm(frames: int = 1 << 20, repeat: int = 3):
+    """ PCM encode/decode throughput, against the per-byte implementation
+        they replaced (kept here as a reference). The old decoder could not
+        read 8 and 24 bit audio.
+    """
+    from math import gcd
+    from babel.synth import Synth
+
+    def old_encode(synth, w):
+        a, b = synth.bits, 8 * synth.type(0).nbytes
+        if a == b:
+            return bytearray(w.tobytes())
+        c = gcd(a, b)
+        a, b = a // c, b // c
+        return bytearray([x for i, x in enumerate(w.tobytes()) if ((i - a) % b)])
+
+    def old_decode(synth, w):
+        return np.frombuffer(w, dtype=synth.type)
+
+    def best(f, *args):
+        times = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            f(*args)
+            times.append(time.perf_counter() - t)
+        return min(times)
+
+    for bits in (8, 16, 24, 32):
+        synth = Synth(bits=bits)
+        x = np.random.default_rng(0).integers(-synth.amp, synth.amp, frames, endpoint=True).astype(synth.type)
+        data = synth._encode(x)
+        a, b = best(old_encode, synth, x), best(synth._encode, x)
+        line = f"pcm {bits:>2} bits: encode {frames / b / 1e6:7.1f}M frames/s (old {frames / a / 1e6:6.1f}M, {a / b:5.1f}x)"
+        c = best(synth._decode, data)
+        if bits in (16, 32):
+            d = best(old_decode, synth, data)
+            line += f", decode {frames / c / 1e6:7.1f}M frames/s (old {frames / d / 1e6:6.1f}M)"
+        else:
+            line += f", decode {frames / c / 1e6:7.1f}M frames/s (old: unsupported)"
+        print(line)
+
+def startup(repeat: int = 5):
+    """ Cold `import babel` (and first parse), each in a fresh interpreter,
+        without and with the cached PLY tables (babel/synth/_parsetab.py).
+    """
+    import os
+    import subprocess
+    from pathlib import Path
+
+    tables = Path("babel/synth/_parsetab.py")
+    scripts = {
+        'import babel' : "import babel",
+        'import + first parse' : "import babel; babel.parser.parse('C4 D4 E4')",
+    }
+
+    def run(code: str) -> float:
+        t = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        return time.perf_counter() - t
+
+    for name, code in scripts.items():
+        cold = []
+        for _ in range(repeat):
+            tables.unlink(missing_ok=True)
+            for pyc in tables.parent.glob("__pycache__/_parsetab.*"):
+                pyc.unlink()
+            cold.append(run(code))
+        warm = [run(code) for _ in range(repeat)] ## tables written by the runs above
+        print(f"{name}: {1e3 * min(cold):.0f} ms without cached tables, {1e3 * min(warm):.0f} ms with them")
+
+def parse(sizes=(2_000, 8_000, 32_000)):
+    """ PLY parser vs. hand-written scanner, on generated scores.
+    """
+    from babel.synth.parser import parser
+    from babel.synth.scanner import scanner
+
+    for notes in sizes:
+        source = score(notes)
+        tokens = len(scanner.tokenize(source))
+        row = []
+        for p in (parser, scanner):
+            p.parse(score(16)) ## build the PLY tables first
+            t = time.perf_counter()
+            code = p.parse(source)
+            row.append((time.perf_counter() - t, code))
+        (a, x), (b, y) = row
+        assert x == y
+        print(f"parse: {tokens:>7,} tokens: ply {1e3 * a:8.1f} ms, scanner {1e3 * b:7.1f} ms ({a / b:5.1f}x), {tokens / b:,.0f} tokens/s")
+
+def notes(size: int = 100_000, repeat: int = 3):
+    """ Compiler.execute over a generated score: notes resolved through
+        per-tone tables vs. the per-note regex and key signature lookup
+        they replaced (kept here as a reference, on formatted notes).
+    """
+    from babel.synth import Compiler, instructions
+    from babel.synth.scanner import scanner
+    from babel.synth.instructions import NOTE_RE, KEYS, ACCIDENTS, get_clef, get_duration
+
+    def old_get_note(compiler, note: str) -> int:
+        m = NOTE_RE.match(note)
+        if m is None: return None ## Pause
+        key, acc, ocv = m.group(1), m.group(2), m.group(3)
+        clef = get_clef(compiler.env['tone'])
+        if acc == '':
+            b = ACCIDENTS[clef[key]] if key in clef else 0
+        else:
+            b = ACCIDENTS[acc]
+        return 12 * (int(ocv) - 4) + b + KEYS[key]
+
+    def old_cmd_note(compiler, note: str, duration, dot):
+        duration = get_duration(compiler, duration)
+        if dot: duration += duration / 2
+        n = old_get_note(compiler, note)
+        return (None if n is None else compiler.env['freq'] * pow(2.0, n / 12.0), duration)
+
+    code = scanner.parse(score(size, repeat=False))
+    old_code = [ ## as the parsers emitted notes before: 'C#4'
+        (cmd, f'{args[0][0]}{args[0][1]}', *args[1:]) if cmd == 'NOTE' and args[0] is not None else (cmd, *args)
+        for cmd, *args in code
+    ]
+
+    results = {}
+    for name, table, c in (('before', {**instructions, 'NOTE': old_cmd_note}, old_code), ('after', instructions, code)):
+        compiler = Compiler(scanner, table)
+        times = []
+        for _ in range(repeat):
+            compiler.reset()
+            t = time.perf_counter()
+            results[name] = [x for x in compiler.execute(c) if x is not None]
+            times.append(time.perf_counter() - t)
+        print(f"notes {name}: {size:,} notes executed in {1e3 * min(times):.1f} ms ({size / min(times):,.0f} notes/s)")
+    assert results['before'] == results['after']
+
+if __name__ == '__main__':
+    benchmarks = {
+        'memory' : memory,
+        'compose' : compose,
+        'train' : train,
+        'live' : live,
+        'store' : store,
+        'pcm' : pcm,
+        'import' : startup,
+        'parse' : parse,
+        'notes' : notes,
+    }
+
+    for key in (sys.argv[1:] or benchmarks):
+        benchmarks[key]()
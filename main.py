@@ -1,3 +1,5 @@
+import os
+
 from babel import Babel
 from babel import Compiler, Synth, parser, instructions, cmd_rel_note, cmd_chord
 
@@ -13,17 +15,21 @@ data = compiler.compile(source)
 wave = synth.synth(data)
 synth.play(wave, True)
 
-## Aprendizado
+## Aprendizado (só na primeira vez: o modelo fica salvo em babel.npz)
 print('Compondo')
-instructions['NOTE'] = cmd_rel_note
-instructions['CHORD'] = cmd_chord
-bb = Babel(instrument='synth')
-compiler = Compiler(parser, instructions)
-data = compiler.compile(source)
-##bb.cm.basic_train()
-bb.cm.seed(5)
-bb.nm.basic_train()
-bb.tm.basic_train()
-bb.train(data, weight=100)
+if os.path.exists('babel.npz'):
+    bb = Babel.load('babel.npz')
+else:
+    instructions['NOTE'] = cmd_rel_note
+    instructions['CHORD'] = cmd_chord
+    bb = Babel(instrument='synth')
+    compiler = Compiler(parser, instructions)
+    data = compiler.compile(source)
+    ##bb.cm.basic_train()
+    bb.cm.seed(5)
+    bb.nm.basic_train()
+    bb.tm.basic_train()
+    bb.train(data, weight=100)
+    bb.save('babel.npz')
 print('Tocando')
 bb.play(10)
\ No newline at end of file
@@ -0,0 +1,33 @@
+from babel.synth import Compiler, parser, instructions
+from babel.synth.cache import CompileCache
+
+def compile_all(cache: CompileCache, fnames: list, runs: int = 3):
+    for _ in range(runs):
+        for fname in fnames:
+            cache.compile(fname)
+    return cache.info()
+
+def test_shared_stem(tmp_path):
+    """ a.b.mus and a.mus do not evict each other """
+    (tmp_path / 'a.b.mus').write_text('C4 D4')
+    (tmp_path / 'a.mus').write_text('E4 F4')
+    cache = CompileCache(Compiler(parser, instructions))
+    assert compile_all(cache, [tmp_path / 'a.b.mus', tmp_path / 'a.mus']) == {'hits': 4, 'misses': 2}
+
+def test_shared_root(tmp_path):
+    """ x/song.mus and y/song.mus do not evict each other under one root """
+    for d, source in (('x', 'C4 D4'), ('y', 'E4 F4')):
+        (tmp_path / d).mkdir()
+        (tmp_path / d / 'song.mus').write_text(source)
+    cache = CompileCache(Compiler(parser, instructions), root=tmp_path / 'cache')
+    fnames = [tmp_path / 'x' / 'song.mus', tmp_path / 'y' / 'song.mus']
+    assert compile_all(cache, fnames) == {'hits': 4, 'misses': 2}
+    assert cache.compile(fnames[1]).frequency.tolist() != cache.compile(fnames[0]).frequency.tolist()
+
+def test_edit_replaces_entry(tmp_path):
+    fname = tmp_path / 'song.mus'
+    cache = CompileCache(Compiler(parser, instructions))
+    for source in ('C4 D4', 'C4 E4'):
+        fname.write_text(source)
+        cache.compile(fname)
+    assert len(list((tmp_path / '__muscache__').glob('song.mus.*.npy'))) == 1
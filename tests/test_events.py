@@ -0,0 +1,19 @@
+import numpy as np
+
+from babel.synth import Events, Synth
+
+def test_save_load_rate(tmp_path):
+    """ offsets come back right, whatever rate they were saved at """
+    notes = [(440.0, 0.25), (None, 0.5), (330.0, 0.25)]
+    for rate in (22_050, 44_100, 48_000):
+        events = Events.from_notes(notes, rate)
+        events.save(tmp_path / 'score.npy')
+        for mmap in (True, False):
+            loaded = Events.load(tmp_path / 'score.npy', mmap=mmap)
+            assert np.array_equal(loaded.at(rate).offset, events.offset)
+            assert np.array_equal(loaded.at(rate).onset, events.onset)
+
+    synth = Synth(sample_rate=22_050)
+    events = Events.from_notes(notes, 22_050)
+    events.save(tmp_path / 'score.npy')
+    assert synth.synth(Events.load(tmp_path / 'score.npy')) == synth.synth(events)
@@ -0,0 +1,30 @@
+import pytest
+
+from babel.synth import Compiler, parser, instructions, cmd_rel_note, cmd_chord
+
+NOTES = 'C4 D4 E4 F4 G4 A4 B4 F#4 Gb4 C§4'
+
+@pytest.mark.parametrize('minor, major', [('Am', 'C'), ('Em', 'G'), ('Bm', 'D'), ('F#m', 'A'), ('C#m', 'E'), ('G#m', 'B')])
+def test_minor_tone(minor, major):
+    """ minor tones share their relative major's key signature """
+    compiler = Compiler(parser, instructions)
+    assert compiler.compile(f'${minor} {NOTES}') == compiler.compile(f'${major} {NOTES}')
+
+
+@pytest.mark.parametrize('tone', ['C', 'D', 'Am', 'Em', 'F#m', 'C#m'])
+def test_training_tonic(tone):
+    """ training codes are measured from the tone's own root """
+    root = tone.rstrip('m')
+    training = Compiler(parser, {**instructions, 'NOTE': cmd_rel_note, 'CHORD': cmd_chord})
+    assert training.compile(f'${tone} {root}4[4] {root}5[8]') == [(0, 2), (12, 3)]
+    if len(root) == 1: ## chords are read without accidentals
+        assert training.compile(f'${tone} {root}') == [(0, None)]
+
+def test_a_minor_has_no_sharps():
+    frequencies = [f for f, _ in Compiler(parser, instructions).compile('$Am C4 F4 G4')]
+    assert [round(f) for f in frequencies] == [523, 698, 784]
+
+@pytest.mark.parametrize('tone', ['Dm', 'Cm'])
+def test_unsupported_tone(tone):
+    with pytest.raises(ValueError):
+        Compiler(parser, instructions).compile(f'${tone} C4')
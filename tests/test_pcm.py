@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from babel.synth import Synth
+
+@pytest.mark.parametrize('bits', [8, 16, 24, 32])
+def test_round_trip(bits):
+    synth = Synth(bits=bits)
+    amp = synth.amp
+    rng = np.random.default_rng(bits)
+
+    for x in (
+        np.array([-amp, -1, 0, 1, amp], dtype=synth.type),
+        rng.integers(-amp, amp, 4096, endpoint=True).astype(synth.type),
+    ):
+        pcm = synth._encode(x)
+        assert isinstance(pcm, bytearray)
+        assert len(pcm) == x.shape[0] * (bits // 8)
+        y = synth._decode(pcm)
+        assert y.dtype == synth.type
+        assert np.array_equal(y, x)
+
+@pytest.mark.parametrize('bits', [8, 16, 24, 32])
+def test_layout(bits):
+    """ WAV samples: 8 bit unsigned (offset binary), wider ones signed little endian
+    """
+    synth = Synth(bits=bits)
+    x = [-synth.amp, -1, 0, 1, synth.amp]
+    if bits == 8:
+        expected = bytes(v + 128 for v in x)
+    else:
+        expected = b''.join(v.to_bytes(bits // 8, 'little', signed=True) for v in x)
+    assert bytes(synth._encode(np.array(x, dtype=synth.type))) == expected
@@ -0,0 +1,67 @@
+from glob import glob
+import random
+
+import pytest
+
+from babel.synth.parser import parser
+from babel.synth.scanner import scanner
+
+SOURCES = sorted(glob('archive/*.mus'))
+
+MALFORMED = [
+    "C4[",
+    "C4[8",
+    "C4[8[",
+    "C4 ]",
+    "(4/4",
+    "(4 4)",
+    "$",
+    "$4",
+    "!",
+    "! C4",
+    "|: C4",
+    "C4 :|",
+    "|: :|",
+    "|: C4 :| :|",
+    "C4 . .",
+    "C4\n\nD4 E4[0]",
+    "C4 x D4",
+    "C4 /* open comment",
+    "x C4",
+    "C4[x]",
+    "C4 D4 &",
+    "C4\n(4/x)",
+    "",
+]
+
+## random token soup, mostly malformed
+ALPHABET = ['C', 'D#', 'Eb', 'A', '4', '8', '12', 'm', 'º', '.', '/', '%', '@', '!', '[', ']', '(', ')', '-', '$', '|:', ':|', ' ', '\n', 'x']
+
+def parse(p, source: str):
+    """ intermediate code, or the SyntaxError message
+    """
+    try:
+        return p.parse(source)
+    except SyntaxError as error:
+        return ('SyntaxError', str(error))
+
+@pytest.mark.parametrize('fname', SOURCES)
+def test_archive(fname):
+    with open(fname, 'r') as file:
+        source = file.read()
+    assert parse(scanner, source) == parse(parser, source)
+
+def test_archive_parses():
+    """ every score but beethoven.mus (a syntax error on line 6) """
+    failed = [fname for fname in SOURCES if parse(scanner, open(fname).read())[0] == 'SyntaxError']
+    assert [fname.replace('\\', '/') for fname in failed] == ['archive/beethoven.mus']
+
+@pytest.mark.parametrize('source', MALFORMED)
+def test_malformed(source):
+    assert parse(scanner, source) == parse(parser, source)
+
+def test_random():
+    rng = random.Random(0)
+    for _ in range(2000):
+        source = ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 12)))
+        assert parse(scanner, source) == parse(parser, source), source
@@ -0,0 +1,56 @@
+from glob import glob
+
+import numpy as np
+import pytest
+
+from babel import Babel, Markos, ChordMarkos, SparseMarkos, TimeMarkos
+
+def trained(order: int) -> Babel:
+    bb = Babel(order=order)
+    bb.cm.seed(5)
+    bb.nm.basic_train()
+    bb.tm.basic_train()
+    bb.train_files(sorted(glob('archive/*.mus')))
+    return bb
+
+def notes(bb: Babel, k: int = 200, seed: int = 1) -> list:
+    Markos.rng.seed(seed)
+    return [next(bb) for _ in range(k)]
+
+@pytest.mark.parametrize('order', [1, 3])
+@pytest.mark.parametrize('mmap', [True, False])
+def test_babel_resumes(tmp_path, order, mmap):
+    """ a model saved mid-bar continues exactly as the original """
+    bb = trained(order)
+    notes(bb, 37, seed=0)
+    assert bb.tm.s is not None ## inside a bar
+
+    bb.save(tmp_path / 'babel.npz')
+    loaded = Babel.load(tmp_path / 'babel.npz', mmap=mmap)
+    assert (loaded.tm.s, loaded.k, loaded.c, loaded.t, loaded.n) == (bb.tm.s, bb.k, bb.c, bb.t, bb.n)
+    assert notes(loaded) == notes(bb)
+
+def test_loaded_model_trains(tmp_path):
+    data = [(0, 2), (4, 2), (3, None), (7, 3), (2, 2)]
+    bb = trained(1)
+    bb.save(tmp_path / 'babel.npz')
+    loaded = Babel.load(tmp_path / 'babel.npz')
+    bb.train(data, weight=5)
+    loaded.train(data, weight=5) ## read-only mapped counts are copied first
+    assert notes(loaded) == notes(bb)
+
+def test_time_markos_state(tmp_path):
+    tm = TimeMarkos((3, 4))
+    tm.basic_train()
+    [next(tm) for _ in range(5)]
+    tm.save(tmp_path / 'time.npz')
+    loaded = TimeMarkos((3, 4)).load(tmp_path / 'time.npz')
+    assert (loaded.s, loaded.prev) == (tm.s, tm.prev)
+
+def test_mismatch(tmp_path):
+    m = ChordMarkos()
+    m.basic_train()
+    m.save(tmp_path / 'chords.npz')
+    assert np.allclose(ChordMarkos().load(tmp_path / 'chords.npz').p, m.p)
+    with pytest.raises(ValueError):
+        SparseMarkos(7).load(tmp_path / 'chords.npz')